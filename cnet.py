@@ -13,9 +13,31 @@
 """
 
 import argparse
+from timeit import default_timer as timer
 import numpy as np
-import networkx as nx
 import scipy.sparse as sparse
+from scipy.sparse.linalg import splu
+
+solvers=['auto','lu','cholesky','cg','amg']
+preconditioners=['jacobi','ilu']
+# networks with more unknowns than this are solved iteratively by solver='auto'
+direct_limit=200000
+# solve_lowrank costs a back substitution and a dense column per changed edge,
+# so past this many changed edges a full solve is cheaper and it falls back
+lowrank_limit=64
+
+def check_solver(solver,preconditioner='jacobi'):
+    """raises for an unknown solver or preconditioner, or for 'amg' without
+    pyamg installed, so that bad settings fail before any network is built"""
+    if solver not in solvers:
+        raise ValueError("solver must be one of {}".format(solvers))
+    if preconditioner not in preconditioners:
+        raise ValueError("preconditioner must be one of {}".format(preconditioners))
+    if solver=='amg':
+        try:
+            import pyamg
+        except ImportError:
+            raise ImportError("solver 'amg' needs pyamg, which is not installed")
 
 class LinExpTransistor():
     def __init__(self,type,onoffmap=0):
@@ -87,28 +109,61 @@ class Resistor(object):
         return self.conductance
 
 class ConductionNetwork(object):
-    """Solves for the conduction characteristics of a physical network"""
-    def __init__(self,graph,ground_nodes,voltage_sources):
+    """Solves for the conduction characteristics of a physical network
+
+    solver selects how the node voltages are found, see solve_mna:
+      'lu': direct sparse LU of the full MNA system, including the voltage
+        source rows
+      'cholesky': Cholesky factorization of the grounded Laplacian with the
+        source nodes eliminated, which is symmetric positive definite. Uses
+        scikit-sparse (CHOLMOD) if it is installed and otherwise a sparse LU
+        of the same reduced matrix.
+      'cg': preconditioned conjugate gradients on the reduced Laplacian, with
+        preconditioner 'jacobi' or 'ilu'
+      'amg': conjugate gradients preconditioned by pyamg smoothed aggregation
+      'auto': 'lu' up to direct_limit unknowns, then 'amg' if pyamg is
+        installed and 'cg' otherwise
+    tol is the relative residual at which the iterative solvers stop. Details
+    of the last solve are kept in solver_info.
+    """
+    def __init__(self,graph,ground_nodes,voltage_sources,solver='auto',tol=1e-10,preconditioner='jacobi'):
         self.graph=graph
         self.ground_nodes=np.array(ground_nodes)
         self.voltage_sources=np.array(voltage_sources)
         self.network_size=len(self.graph)
+        # fixed node ordering shared by the MNA matrix and the solution vector
+        self.nodelist=sorted(self.graph.nodes())
+        # edges as int32 positions into nodelist, the order of the conductance,
+        # voltage and current arrays kept alongside the graph attributes
+        index={node:i for i,node in enumerate(self.nodelist)}
+        self.edgelist=list(self.graph.edges)
+        self.edge_index=np.array([[index[n1],index[n2]] for n1,n2 in self.edgelist],dtype=np.int32).reshape(-1,2)
         self.gate_areas=[]
         self.vds=0.1
+        self.base_lu=None
+        self.base_conductance=None
+        check_solver(solver,preconditioner)
+        self.solver=solver
+        self.tol=tol
+        self.preconditioner=preconditioner
+        self.solver_info={}
 
     def update_conductivity(self):
-        for edge in self.graph.edges:
-            G=self.graph.edges[edge]['component'].get_conductance()
-            self.graph.edges[edge]['conductance']=G
-            self.graph.edges[edge]['resistance']=1/G
-    def make_G(self):
-        """Generates the adjacency matrix of the graph as a numpy array and then sets the diagonal elements as the -ve sum of the conductances that attach to it.
+        self.conductance=np.empty(len(self.edgelist))
+        for k,edge in enumerate(self.edgelist):
+            attributes=self.graph.edges[edge]
+            G=attributes['component'].get_conductance()
+            attributes['conductance']=G
+            attributes['resistance']=1/G
+            self.conductance[k]=G
+    def make_G(self,conductance=None):
+        """Generates the adjacency matrix of the graph as a sparse matrix and then sets the diagonal elements as the -ve sum of the conductances that attach to it.
         """
-        G=nx.to_scipy_sparse_matrix(self.graph,nodelist=self.graph.nodes(),weight='conductance',format='lil')
-        dsum=G.sum(axis=0)
-        for i in range(self.network_size):
-            G[i,i]=-dsum[0,i]
-        return G
+        if conductance is None:
+            conductance=self.conductance
+        n1,n2=self.edge_index.T
+        G=sparse.coo_matrix((np.append(conductance,conductance),(np.append(n1,n2),np.append(n2,n1))),shape=(self.network_size,self.network_size)).tocsr()
+        return G-sparse.diags(np.asarray(G.sum(axis=0)).ravel())
     def delete_sparse_rcs(self,mat,indices):
         row_mask = np.ones(mat.shape[0], dtype=bool)
         row_mask[indices] = False
@@ -116,14 +171,9 @@ class ConductionNetwork(object):
         col_mask[indices] = False
         return mat[row_mask][:,col_mask]
     def make_A(self, G):
-        B=np.zeros((self.network_size,len(self.voltage_sources)))
-        for i in range(self.network_size):
-            if i in self.voltage_sources[:,0]:
-                B[i,list(self.voltage_sources[:,0]).index(i)]=1
-        D=np.zeros((len(self.voltage_sources),len(self.voltage_sources)))
-        BTD=np.append(B.T,D,axis=1)
-        A=sparse.hstack([G,B],format='lil')
-        A=sparse.vstack([A,BTD],format='lil')
+        m=len(self.voltage_sources)
+        B=sparse.coo_matrix((np.ones(m),(self.voltage_sources[:,0].astype(int),np.arange(m))),shape=(self.network_size,m))
+        A=sparse.bmat([[G,B],[B.T,sparse.coo_matrix((m,m))]],format='csr')
         A=self.delete_sparse_rcs(A,self.ground_nodes)
         return sparse.csr_matrix(A)
     def make_z(self):
@@ -133,20 +183,110 @@ class ConductionNetwork(object):
         for i in self.ground_nodes:
             x=np.insert(x,i,0,axis=0)
         self.source_currents=x[-len(self.voltage_sources):]
-        x=x[:-len(self.voltage_sources)]
-        for i in range(len(self.graph.nodes)) :
-            node=sorted(self.graph.nodes())[i]
-            self.graph.nodes[node]['voltage']=float(x[i])
+        self.voltages=np.asarray(x[:-len(self.voltage_sources)],dtype=float).ravel()
+        for i,node in enumerate(self.nodelist):
+            self.graph.nodes[node]['voltage']=float(self.voltages[i])
     def update_currents(self):
-        for n1,n2 in self.graph.edges:
-            g = float(self.graph.edges[n1,n2]['conductance'])
-            dV = float(self.graph.nodes[n1]['voltage']) - float(self.graph.nodes[n2]['voltage'])
-            # to include current directionality one would have to
-            #replace the abs with some sort of node-node direction rules
-            self.graph.edges[n1,n2]['current']= abs(g * dV)
+        n1,n2=self.edge_index.T
+        # to include current directionality one would have to
+        #replace the abs with some sort of node-node direction rules
+        self.currents=np.abs(self.conductance*(self.voltages[n1]-self.voltages[n2]))
+        for k,edge in enumerate(self.edgelist):
+            self.graph.edges[edge]['current']=float(self.currents[k])
+    def select_solver(self):
+        if self.solver!='auto':
+            return self.solver
+        if self.network_size<=direct_limit:
+            return 'lu'
+        try:
+            import pyamg
+            return 'amg'
+        except ImportError:
+            return 'cg'
     def solve_mna(self):
-        mna_x=sparse.linalg.spsolve(self.make_A(self.make_G()), self.make_z())
+        """Returns the MNA solution vector, the node voltages without the
+        ground nodes followed by the voltage source currents, whichever solver
+        is used. solver_info records the solver, iterations, relative residual
+        and time taken."""
+        start=timer()
+        solver=self.select_solver()
+        if solver=='lu':
+            A=self.make_A(self.make_G())
+            z=self.make_z()[:,0]
+            mna_x=sparse.linalg.spsolve(A,z)
+            residual=float(np.linalg.norm(A.dot(mna_x)-z)/(np.linalg.norm(z) or 1))
+            self.solver_info={'solver':'lu','backend':'spsolve','iterations':0,'residual':residual}
+        else:
+            mna_x=self.solve_laplacian(solver)
+        self.solver_info['time']=timer()-start
         return mna_x
+    def reduced_laplacian(self):
+        """Splits the Laplacian L=-G into the unknown nodes (neither ground
+        nor source) and the nodes of known voltage. Returns L, the unknown node
+        indices, the known node indices and their voltages."""
+        L=-self.make_G()
+        known=np.append(self.ground_nodes,self.voltage_sources[:,0]).astype(int)
+        vknown=np.append(np.zeros(len(self.ground_nodes)),self.voltage_sources[:,1]).astype(float)
+        unknown=np.setdiff1d(np.arange(self.network_size),known)
+        return L.tocsr(),unknown,known,vknown
+    def solve_laplacian(self,solver):
+        """Solves L_uu v_u = -L_uk v_k for the voltages of the unknown nodes.
+        With the ground and source nodes eliminated L_uu is symmetric positive
+        definite as the network is connected. The source currents are then
+        (L v) at the source nodes."""
+        L,unknown,known,vknown=self.reduced_laplacian()
+        Luu=L[unknown][:,unknown]
+        b=-L[unknown][:,known].dot(vknown)
+        iterations=0
+        if solver=='cholesky':
+            try:
+                from sksparse.cholmod import cholesky
+                vu=cholesky(Luu.tocsc())(b)
+                backend='cholmod'
+            except ImportError:
+                vu=splu(Luu.tocsc()).solve(b)
+                backend='splu'
+        elif solver in ('cg','amg'):
+            from scipy.sparse.linalg import cg, LinearOperator, spilu
+            if solver=='amg':
+                import pyamg
+                M=pyamg.smoothed_aggregation_solver(Luu.tocsr(),symmetry='hermitian').aspreconditioner(cycle='V')
+                backend='pyamg'
+            elif self.preconditioner=='ilu':
+                # symmetric mode without pivoting keeps the factors close to
+                # an incomplete Cholesky, as cg needs a symmetric preconditioner
+                ilu=spilu(Luu.tocsc(),drop_tol=1e-3,fill_factor=10,permc_spec='MMD_AT_PLUS_A',diag_pivot_thresh=0,options={'SymmetricMode':True})
+                M=LinearOperator(Luu.shape,ilu.solve)
+                backend='ilu'
+            else:
+                M=sparse.diags(1/Luu.diagonal())
+                backend='jacobi'
+            # warm start from the last solution, which is close during sweeps
+            x0=None
+            if getattr(self,'voltages',None) is not None and len(self.voltages)==self.network_size:
+                x0=self.voltages[unknown]
+            counter=[0]
+            def count(xk):
+                counter[0]+=1
+            try:
+                vu,status=cg(Luu,b,x0=x0,rtol=self.tol,atol=0,maxiter=10*len(b)+100,M=M,callback=count)
+            except TypeError:
+                # scipy before 1.12 calls the relative tolerance tol
+                counter=[0]
+                vu,status=cg(Luu,b,x0=x0,tol=self.tol,maxiter=10*len(b)+100,M=M,callback=count)
+            iterations=counter[0]
+            if status>0:
+                print("WARNING: {} did not converge in {} iterations".format(solver,iterations))
+        else:
+            raise ValueError("unknown solver {}".format(solver))
+        v=np.zeros(self.network_size)
+        v[known]=vknown
+        v[unknown]=vu
+        residual=float(np.linalg.norm(Luu.dot(vu)-b)/(np.linalg.norm(b) or 1))
+        self.solver_info={'solver':solver,'backend':backend,'iterations':iterations,'residual':residual}
+        # arranged as the MNA solution, ground nodes deleted, currents appended
+        currents=L[self.voltage_sources[:,0].astype(int)].dot(v)
+        return np.append(np.delete(v,self.ground_nodes),currents)
     def update(self,show=True,v=False):
         #process mna_x to seperate out relevant components
         self.update_conductivity()
@@ -155,6 +295,96 @@ class ConductionNetwork(object):
         self.update_currents()
         pass
 
+    def factor_base(self):
+        """Factors the MNA matrix at the present conductances and stores the
+        base solution. Changing the conductance of a few edges is then a rank k
+        (Sherman-Morrison-Woodbury) correction to this base, see solve_lowrank.
+        The factorization is only made when select_solver picks a direct
+        solver, otherwise base_lu is None and every solve is a full one with
+        the selected solver.
+        """
+        self.update_conductivity()
+        self.base_edges=self.edgelist
+        self.base_pos=np.array([self.graph.edges[e]['pos'] for e in self.base_edges],dtype=float).reshape(-1,2)
+        self.base_conductance=self.conductance.copy()
+        # row of each node in the MNA system once the ground rows are deleted,
+        # -1 for the ground nodes themselves
+        rows=np.arange(self.network_size)
+        rows=rows-np.searchsorted(np.sort(self.ground_nodes),rows)
+        rows[self.ground_nodes]=-1
+        self.base_ends=rows[self.edge_index]
+        if self.select_solver() in ('lu','cholesky'):
+            self.base_lu=splu(sparse.csc_matrix(self.make_A(self.make_G())))
+            self.base_x=self.base_lu.solve(self.make_z()[:,0].astype(float))
+        else:
+            self.base_lu=None
+            self.base_x=self.solve_mna()
+    def solve_conductance(self,conductance):
+        """MNA solution vector with the edges at conductance, by the selected
+        solver, leaving the stored conductances as they are"""
+        stored=self.conductance
+        self.conductance=conductance
+        try:
+            return self.solve_mna()
+        finally:
+            self.conductance=stored
+    def solve_lowrank(self,edges,conductances):
+        """Solves the MNA system with the edges (indices into base_edges) set
+        to the given conductances and every other edge at its base value.
+        Costs k back substitutions and a k x k dense solve for k changed edges,
+        which only pays off for a few edges such as a small gate window. Above
+        lowrank_limit changed edges, or without a factored base, it falls back
+        to a full solve with the selected solver.
+        """
+        edges=np.asarray(edges,dtype=int)
+        dG=np.asarray(conductances,dtype=float)-self.base_conductance[edges]
+        changed=dG!=0
+        edges,dG=edges[changed],dG[changed]
+        if not len(edges):
+            return self.base_x.copy()
+        k=len(edges)
+        if k>lowrank_limit or self.base_lu is None:
+            conductance=self.base_conductance.copy()
+            conductance[edges]+=dG
+            return self.solve_conductance(conductance)
+        # one +1/-1 column per edge, with no entries for grounded ends
+        n1,n2=self.base_ends[edges].T
+        cols=np.arange(k)
+        rows=np.append(n1,n2)
+        keep=rows>=0
+        U=sparse.csc_matrix((np.append(np.ones(k),-np.ones(k))[keep],(rows[keep],np.append(cols,cols)[keep])),shape=(len(self.base_x),k))
+        W=self.base_lu.solve(U.toarray())
+        # make_G holds the negative laplacian, so raising an edge conductance
+        # by dG adds -dG*u*u^T to the system matrix
+        C=-dG
+        S=np.eye(k)+C[:,None]*U.T.dot(W)
+        return self.base_x-W.dot(np.linalg.solve(S,C*U.T.dot(self.base_x)))
+    def get_local_edge_indices(self,area):
+        """vectorized get_local_edges, returning indices into base_edges"""
+        x,y=self.base_pos[:,0],self.base_pos[:,1]
+        mask=((area[0]-area[2]/2<=x)&(x<=area[0]+area[2]/2)&
+              (area[1]-area[3]/2<=y)&(y<=area[1]+area[3]/2))
+        return np.flatnonzero(mask)
+    def gated_conductance(self,edges,voltage):
+        """conductance of the edges (indices into base_edges) at a gate
+        voltage, leaving the components themselves untouched"""
+        G=np.empty(len(edges))
+        for k,i in enumerate(edges):
+            component=self.graph.edges[self.base_edges[i]]['component']
+            old=component.gate_voltage
+            component.gate_voltage=voltage
+            G[k]=component.get_conductance()
+            component.gate_voltage=old
+        return G
+    def lowrank_local_gate(self,area,voltage):
+        """Solves for a local gate over area against the factored base, see
+        factor_base. Returns the MNA solution vector and sets source_currents.
+        """
+        edges=self.get_local_edge_indices(area)
+        mna_x=self.solve_lowrank(edges,self.gated_conductance(edges,voltage))
+        self.source_currents=mna_x[-len(self.voltage_sources):]
+        return mna_x
+
 
     def set_global_gate(self,voltage):
         for edge in self.graph.edges:
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+    File name: fielddata.py
+    Author: Leo Browning
+    email: leobrowning92@gmail.com
+    Date created: 19/10/2026 (DD/MM/YYYY)
+    Python Version: 3.5
+    Description:
+    On disk dataset of the node voltages and edge currents of a solved
+    network over gate sweeps, so that fields can be analysed and rendered
+    without reloading and re-solving the device. A dataset is a directory of
+    .npy files, opened as memory maps:
+        meta.json                 gates, sizes and number of frames per gate
+        node_pos.npy              (nodes, 2) node positions, cnet.nodelist order
+        edge_pos.npy              (edges, 2) junction positions, cnet.edgelist order
+        edge_index.npy            (edges, 2) node positions of each edge's ends
+        vg_<gate>.npy             (frames,) gate voltage of each frame
+        voltage_<gate>.npy        (frames, nodes) node voltages
+        current_<gate>.npy        (frames, edges) edge currents
+    Each frame is one contiguous row, so reading a frame reads only that
+    frame. Frames are stored in the order they were solved, and are returned
+    sorted by vg.
+"""
+import os, json
+import numpy as np
+from numpy.lib.format import open_memmap
+
+class FieldWriter(object):
+    """
+    Args:
+      path: directory of the dataset, created if needed
+      cnet: solved cnet.ConductionNetwork, for the node and edge layout
+      gates: dict of gate type to the largest number of frames it will hold
+      scaling: device size in um, kept for rendering
+      dtype: dtype of the stored fields
+      frames: dict of gate type to the number of frames to keep from an
+        existing dataset at path, which is reopened rather than replaced.
+        Used to resume interrupted sweeps, see measure_perc.SweepCheckpoint.
+    """
+    def __init__(self,path,cnet,gates,scaling=5,dtype=np.float64,frames=None):
+        self.path=path
+        if frames is not None and os.path.isfile(os.path.join(path,'meta.json')):
+            self.reopen(frames)
+            return
+        os.makedirs(path,exist_ok=True)
+        graph=cnet.graph
+        np.save(os.path.join(path,'node_pos.npy'),np.array([graph.nodes[k]['pos'] for k in cnet.nodelist],dtype=float).reshape(-1,2))
+        np.save(os.path.join(path,'edge_pos.npy'),np.array([graph.edges[k]['pos'] for k in cnet.edgelist],dtype=float).reshape(-1,2))
+        np.save(os.path.join(path,'edge_index.npy'),cnet.edge_index)
+        self.meta={'nodes':len(cnet.nodelist), 'edges':len(cnet.edgelist), 'scaling':scaling, 'dtype':np.dtype(dtype).name, 'gates':list(gates), 'frames':{g:0 for g in gates}}
+        self.arrays={}
+        for g,capacity in gates.items():
+            self.arrays[g]=(open_memmap(self._file('vg',g),mode='w+',dtype=float,shape=(capacity,)),
+                open_memmap(self._file('voltage',g),mode='w+',dtype=dtype,shape=(capacity,self.meta['nodes'])),
+                open_memmap(self._file('current',g),mode='w+',dtype=dtype,shape=(capacity,self.meta['edges'])))
+        self.write_meta()
+
+    def reopen(self,frames):
+        with open(os.path.join(self.path,'meta.json')) as f:
+            self.meta=json.load(f)
+        self.arrays={g:tuple(open_memmap(self._file(value,g),mode='r+') for value in ('vg','voltage','current')) for g in self.meta['gates']}
+        # meta.json is only rewritten on close, so the frame counts come from
+        # the caller, who knows which frames were completely written
+        for g in self.meta['gates']:
+            self.meta['frames'][g]=min(frames.get(g,0),len(self.arrays[g][0]))
+        self.write_meta()
+
+    def _file(self,value,gate):
+        return os.path.join(self.path,'{}_{}.npy'.format(value,gate))
+
+    def write_meta(self):
+        with open(os.path.join(self.path,'meta.json'),'w') as f:
+            json.dump(self.meta,f)
+
+    def write(self,gate,vg,cnet):
+        """stores the present voltages and currents of cnet as a frame"""
+        i=self.meta['frames'][gate]
+        vgs,voltages,currents=self.arrays[gate]
+        if i>=len(vgs):
+            raise IndexError("{} gate dataset is full at {} frames".format(gate,len(vgs)))
+        vgs[i]=vg
+        voltages[i]=cnet.voltages
+        currents[i]=cnet.currents
+        self.meta['frames'][gate]=i+1
+
+    def close(self):
+        for arrays in self.arrays.values():
+            for a in arrays:
+                a.flush()
+        self.arrays={}
+        self.write_meta()
+
+class FieldDataset(object):
+    """Read only access to a dataset written by FieldWriter. Frames are
+    indexed in order of increasing vg."""
+    def __init__(self,path):
+        self.path=path
+        with open(os.path.join(path,'meta.json')) as f:
+            self.meta=json.load(f)
+        self.gates=self.meta['gates']
+        self.scaling=self.meta['scaling']
+        self.node_pos=np.load(os.path.join(path,'node_pos.npy'))
+        self.edge_pos=np.load(os.path.join(path,'edge_pos.npy'))
+        self.edge_index=np.load(os.path.join(path,'edge_index.npy'))
+        self._order={}
+
+    def _load(self,value,gate):
+        return np.load(os.path.join(self.path,'{}_{}.npy'.format(value,gate)),mmap_mode='r')[:self.meta['frames'][gate]]
+
+    def order(self,gate):
+        if gate not in self._order:
+            self._order[gate]=np.argsort(self._load('vg',gate),kind='stable')
+        return self._order[gate]
+
+    def vg(self,gate):
+        """gate voltages of the stored frames, sorted"""
+        return np.asarray(self._load('vg',gate))[self.order(gate)]
+
+    def index(self,gate,vg):
+        """index of the frame at vg"""
+        vgs=self.vg(gate)
+        i=int(np.argmin(np.abs(vgs-vg))) if len(vgs) else -1
+        if i<0 or not np.isclose(vgs[i],vg):
+            raise KeyError("no {} gate frame at vg = {}".format(gate,vg))
+        return i
+
+    def pos(self,value):
+        return self.node_pos if value=='voltage' else self.edge_pos
+
+    def frame(self,gate,value,i):
+        """voltages or currents of frame i, read from disk"""
+        return np.asarray(self._load(value,gate)[self.order(gate)[i]])
+
+    def frames(self,gate,value):
+        """(frames, nodes or edges) array of every frame in sorted order"""
+        return self._load(value,gate)[self.order(gate)]
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+    File name: geomcache.py
+    Author: Leo Browning
+    email: leobrowning92@gmail.com
+    Date created: 19/10/2026 (DD/MM/YYYY)
+    Python Version: 3.5
+    Description:
+    Content addressed on disk cache of generated networks. Each entry holds
+    the sticks and intersects after intersection finding together with the
+    percolating cluster, keyed by a hash of the generation parameters and of
+    the generator code, so that changing the code invalidates old entries.
+    The cache is kept under a size limit by evicting the least recently used
+    entries. See RandomConductingNetwork(cache=...) in netsim.py.
+"""
+import os, json, hashlib, tempfile
+import numpy as np
+from netarrays import StickArrays, IntersectArrays
+
+stick_fields=['xc','yc','angle','length','kind','cluster']
+intersect_fields=['stick1','stick2','x','y','kind']
+
+def get_cache(cache=None):
+    """
+    Args:
+      cache: a GeometryCache, a directory path, False to disable caching or
+        None to use the directory in the NETSIM_CACHE environment variable
+        if it is set
+
+    Returns:
+        a GeometryCache or None
+    """
+    if isinstance(cache,GeometryCache):
+        return cache
+    if cache is None:
+        cache=os.environ.get('NETSIM_CACHE','')
+    if not cache:
+        return None
+    return GeometryCache(cache)
+
+class GeometryCache(object):
+    """
+    Args:
+      directory: where the .npz entries are kept
+      max_bytes: total size above which least recently used entries are
+        evicted, defaults to NETSIM_CACHE_BYTES or 4 GB
+    """
+    def __init__(self,directory,max_bytes=None):
+        self.directory=os.path.expanduser(directory)
+        os.makedirs(self.directory,exist_ok=True)
+        if max_bytes is None:
+            max_bytes=int(float(os.environ.get('NETSIM_CACHE_BYTES',4e9)))
+        self.max_bytes=max_bytes
+
+    def key(self,**params):
+        """sha256 of the parameters, which must be json serializable"""
+        return hashlib.sha256(json.dumps(params,sort_keys=True).encode()).hexdigest()
+
+    def path(self,key):
+        return os.path.join(self.directory,key+'.npz')
+
+    def get(self,key):
+        """(sticks, intersects, spanning cluster) or None on a miss"""
+        path=self.path(key)
+        try:
+            with np.load(path) as entry:
+                dtype=entry['s_xc'].dtype
+                sticks=StickArrays(*[entry['s_'+f] for f in stick_fields],dtype=dtype)
+                intersects=IntersectArrays(*[entry['i_'+f] for f in intersect_fields],dtype=dtype)
+                cluster=entry['cluster']
+        except (IOError,OSError,KeyError,ValueError):
+            return None
+        # the modification time doubles as the last use for eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return sticks,intersects,cluster
+
+    def put(self,key,sticks,intersects,cluster):
+        arrays={'s_'+f:getattr(sticks,f) for f in stick_fields}
+        arrays.update({'i_'+f:getattr(intersects,f) for f in intersect_fields})
+        arrays['cluster']=np.asarray(cluster,dtype=np.int32)
+        # written to a temporary file and renamed so that concurrent jobs
+        # never read a partial entry
+        fd,tmp=tempfile.mkstemp(dir=self.directory,suffix='.tmp')
+        with os.fdopen(fd,'wb') as f:
+            np.savez(f,**arrays)
+        os.replace(tmp,self.path(key))
+        self.evict()
+
+    def entries(self):
+        """(mtime, size, path) of every entry, least recently used first"""
+        entries=[]
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz'):
+                path=os.path.join(self.directory,name)
+                try:
+                    stat=os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime,stat.st_size,path))
+        return sorted(entries)
+
+    def evict(self):
+        entries=self.entries()
+        total=sum(e[1] for e in entries)
+        for mtime,size,path in entries:
+            if total<=self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total-=size
+
+    def clear(self):
+        for mtime,size,path in self.entries():
+            os.remove(path)
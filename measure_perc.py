@@ -12,15 +12,16 @@
     simulations and graphical output see the viewnet module.
 """
 
-import os,argparse,traceback,sys,textwrap
+import os,argparse,traceback,sys,textwrap,csv,pickle,shutil,tempfile
 import netsim
+import geomcache
+import netstats
 from timeit import default_timer as timer
-import pandas as pd
 import numpy as np
-import networkx as nx
 from multiprocessing import Pool
 import uuid as id
-from cnet import LinExpTransistor,FermiDiracTransistor
+from cnet import LinExpTransistor,FermiDiracTransistor,solvers,preconditioners
+from fielddata import FieldWriter
 
 elements=[FermiDiracTransistor,LinExpTransistor]
 
@@ -36,56 +37,248 @@ def checkdir(directoryname):
     if not(os.path.isdir(directoryname)):
         os.system("mkdir " + directoryname)
     pass
-def add_voltagemeas(device, data, vgrange=10, vgnum=3):
+def adaptive_sweep(measure, vgvalues, vgtol, maxsolves=0):
+    """
+    Refines a gate voltage grid where the current changes quickly. Starting
+    from vgvalues, the interval with the largest change in log10|current|
+    is bisected until no interval changes by more than vgtol decades, the
+    intervals are too narrow to split further, or maxsolves measurements
+    have been made.
+
+    Args:
+      measure: function of vg returning the current
+      vgvalues: initial grid, always measured
+      vgtol: largest change in log10|current| allowed between neighbouring
+        points
+      maxsolves: cap on the total number of measurements, 0 for 4*len(vgvalues).
+        As the initial grid is always measured it must be at least that long.
+
+    Returns:
+        sorted vg values and the currents measured at them
+    """
+    import heapq
+    vgvalues=sorted(vgvalues)
+    if not maxsolves:
+        maxsolves=4*len(vgvalues)
+    if maxsolves<len(vgvalues):
+        raise ValueError("maxsolves {} is less than the {} points of the initial grid".format(maxsolves,len(vgvalues)))
+    minstep=(vgvalues[-1]-vgvalues[0])/1000
+    points={vg:measure(vg) for vg in vgvalues}
+    def change(v1,v2):
+        c1,c2=[np.log10(max(abs(points[v]),1e-300)) for v in (v1,v2)]
+        return abs(c2-c1)
+    # max heap of intervals by their change in current
+    heap=[(-change(v1,v2),v1,v2) for v1,v2 in zip(vgvalues[:-1],vgvalues[1:])]
+    heapq.heapify(heap)
+    while heap and len(points)<maxsolves:
+        dc,v1,v2=heapq.heappop(heap)
+        if -dc<=vgtol:
+            break
+        if v2-v1<2*minstep:
+            continue
+        vm=(v1+v2)/2
+        points[vm]=measure(vm)
+        heapq.heappush(heap,(-change(v1,vm),v1,vm))
+        heapq.heappush(heap,(-change(vm,v2),vm,v2))
+    vgvalues=sorted(points)
+    return vgvalues,[points[vg] for vg in vgvalues]
+
+def sweep_capacity(vgnum, vgtol=0, maxsolves=0):
+    """largest number of points add_voltagemeas measures per gate, raising
+    the ValueError of adaptive_sweep for a maxsolves below vgnum"""
+    if vgtol:
+        if maxsolves and maxsolves<vgnum:
+            raise ValueError("maxsolves {} is less than the {} points of the initial grid".format(maxsolves,vgnum))
+        return maxsolves or 4*vgnum
+    return vgnum
+
+class SweepCheckpoint(object):
+    """
+    State of an interrupted single_measure kept in a directory: the generated
+    geometry as a geomcache.GeometryCache entry, and in state.pkl the
+    currents of every completed (gate, vg) point together with the cluster
+    information, graph statistics, field dataset frame counts and time spent
+    so far. state.pkl is rewritten atomically after every point, so a killed
+    job loses at most the solve in progress.
+
+    Args:
+      directory: where the checkpoint is kept
+      params: measurement parameters, a checkpoint made with different ones
+        is discarded
+    """
+    def __init__(self,directory,params):
+        self.directory=directory
+        os.makedirs(directory,exist_ok=True)
+        self.state={'params':params,'points':{},'frames':None,'info':{},'runtime':0}
+        self.resumed=False
+        self.start=timer()
+        try:
+            with open(self.path,'rb') as f:
+                state=pickle.load(f)
+            if state['params']==params:
+                self.state=state
+                self.resumed=True
+        except (IOError,OSError,EOFError,pickle.UnpicklingError,KeyError):
+            pass
+        # time spent in earlier attempts
+        self.previous=self.state['runtime']
+
+    @property
+    def path(self):
+        return os.path.join(self.directory,'state.pkl')
+
+    @property
+    def info(self):
+        """results kept across restarts, such as cluster sizes"""
+        return self.state['info']
+
+    def get(self,gate,vg):
+        """current of a completed point or None"""
+        return self.state['points'].get((gate,float(vg)))
+
+    def solve(self,gate,vg):
+        """(solver, iterations, residual) of a completed point"""
+        return self.state.get('solves',{}).get((gate,float(vg)),(None,np.nan,np.nan))
+
+    def add(self,gate,vg,current,fields=None,solve=None):
+        self.state['points'][(gate,float(vg))]=current
+        if solve:
+            self.state.setdefault('solves',{})[(gate,float(vg))]=solve
+        if fields:
+            self.state['frames']=dict(fields.meta['frames'])
+        self.save()
+
+    def save(self):
+        self.state['runtime']=self.previous+timer()-self.start
+        fd,tmp=tempfile.mkstemp(dir=self.directory,suffix='.tmp')
+        with os.fdopen(fd,'wb') as f:
+            pickle.dump(self.state,f)
+        os.replace(tmp,self.path)
+
+    def remove(self):
+        shutil.rmtree(self.directory,ignore_errors=True)
+
+def add_voltagemeas(device, data, vgrange=10, vgnum=3, gates=('back', 'partial', 'total'), vgtol=0, maxsolves=0, fields=None, checkpoint=None):
+    """
+    Sweeps each gate over vg, on a fixed np.linspace(-vgrange,vgrange,vgnum)
+    grid or, if vgtol is set, on that grid refined by adaptive_sweep so that
+    neighbouring currents differ by at most vgtol decades, with at most
+    maxsolves solves per gate. Either way the rows are ordered by gate and
+    vg, and include vg=+-vgrange. If fields is a fielddata.FieldWriter the
+    voltages and currents of every solve are written to it. Points already
+    completed in checkpoint, a SweepCheckpoint, are not solved again. The
+    solver, iterations and relative residual of each solve are kept in the
+    solver, iterations and residual columns, see cnet.ConductionNetwork.
+    """
     gate=[]
     gatevoltage=[]
     current=[]
+    solves={}
     vgvalues=np.linspace(-vgrange,vgrange,vgnum)
-    for g in ['back', 'partial', 'total']:
-        for vg in vgvalues:
+    for g in gates:
+        def measure(vg):
+            if checkpoint and checkpoint.get(g,vg) is not None:
+                solves[(g,float(vg))]=checkpoint.solve(g,vg)
+                return checkpoint.get(g,vg)
             c=device.gate(vg,g)
-            current.append(c)
-            gate.append(g)
-            gatevoltage.append(vg)
+            info=device.cnet.solver_info
+            solves[(g,float(vg))]=(info['solver'],info['iterations'],info['residual'])
+            if fields:
+                fields.write(g,vg,device.cnet)
+            if checkpoint:
+                checkpoint.add(g,vg,c,fields,solves[(g,float(vg))])
+            return c
+        if vgtol:
+            vgs,currents=adaptive_sweep(measure, vgvalues, vgtol, maxsolves)
+        else:
+            vgs,currents=vgvalues,[measure(vg) for vg in vgvalues]
+        current+=list(currents)
+        gate+=[g]*len(vgs)
+        gatevoltage+=list(vgs)
     data.gate=gate
     data.gatevoltage=gatevoltage
     data.current=current
+    data['solver'],data['iterations'],data['residual']=zip(*[solves[(g,float(vg))] for g,vg in zip(gate,gatevoltage)])
     return data
-def single_measure(n,scaling,l='exp', dump=False, savedir='test', seed=0, onoffmap=0, v=False, element= LinExpTransistor,vgrange=10,vgnum=3):
-    datacol=['sticks', 'scaling', 'density', 'current', 'gatevoltage','gate', 'nclust', 'maxclust', 'fname','onoffmap', 'seed', 'runtime', 'element']
+def single_measure(n,scaling,l='exp', dump=False, savedir='test', seed=0, onoffmap=0, v=False, element= LinExpTransistor,vgrange=10,vgnum=3,cache=None,vgtol=0,maxsolves=0,solver='auto',tol=1e-10,preconditioner='jacobi',fields=False,stats=0,checkpoint=False,compress=False,writer=None,periodic=False):
+    """
+    Builds one device and sweeps every gate type over vg, saving the data to
+    <fname>_data.csv.
+
+    With checkpoint, the geometry and each completed sweep point are kept in
+    <fname>_checkpoint (or in that name under checkpoint if it is a
+    directory) and a rerun with the same arguments and a nonzero seed resumes
+    from there. The checkpoint is removed once the data is saved.
+
+    compress gzips the dumped sticks and intersects. Given a BackgroundWriter
+    as writer, the dump and data files are written on its thread while the
+    measurement carries on, see measure_pipeline.
+
+    periodic joins the y=0 and y=1 boundaries of the device, and solver, tol
+    and preconditioner set how it is solved, see
+    netsim.RandomConductingNetwork.
+    """
+    # imported here rather than at module level to keep startup lean, see
+    # measure_batch for running many measurements in one process
+    import pandas as pd
+    import networkx as nx
+    datacol=['sticks', 'scaling', 'density', 'current', 'gatevoltage','gate', 'nclust', 'maxclust', 'fname','onoffmap', 'seed', 'runtime', 'element', 'periodic', 'solver', 'iterations', 'residual']
     checkdir(savedir)
     start = timer()
 
     # variables initialized
 
     d=n/scaling**2
+    # checked before any work is done, and the size of the field dataset
+    capacity=sweep_capacity(vgnum,vgtol,maxsolves)
     if not(seed):
         seed=np.random.randint(low=0,high=2**32)
-    fname=os.path.join(savedir,"mnet{:2.2f}_s{}_l{}_om{}_el{}_seed{:010d}".format(d,scaling,l,onoffmap,elements.index(element),seed))
+    fname=os.path.join(savedir,"mnet{:2.2f}_s{}_l{}_om{}_el{}_seed{:010d}{}".format(d,scaling,l,onoffmap,elements.index(element),seed,"_periodic" if periodic else ""))
     data=pd.DataFrame(columns = datacol)
     if v:
         print("=== measurement start ===\nn{:05d}_d{:2.1f}_seed{:010d}".format( n, d, seed))
 
+    ckpt=None
+    if checkpoint:
+        ckdir=fname+"_checkpoint" if checkpoint is True else os.path.join(checkpoint,os.path.basename(fname)+"_checkpoint")
+        params={'n':n, 'scaling':scaling, 'l':l, 'seed':int(seed), 'onoffmap':onoffmap, 'element':element.__name__, 'vgrange':vgrange, 'vgnum':vgnum, 'vgtol':vgtol, 'maxsolves':maxsolves, 'solver':solver, 'tol':tol, 'preconditioner':preconditioner, 'fields':bool(fields), 'stats':stats, 'periodic':bool(periodic)}
+        ckpt=SweepCheckpoint(ckdir,params)
+        # the geometry is kept with the checkpoint unless a cache holds it
+        cache=geomcache.get_cache(cache) or geomcache.GeometryCache(ckdir)
+        if v and ckpt.resumed:
+            print("=== resuming from {} with {} points done".format(ckdir,len(ckpt.state['points'])))
+
     #device created
-    device=netsim.RandomCNTNetwork(n=n,scaling=scaling,notes='run',l=l,seed=seed,onoffmap=onoffmap,element=element)
+    device=netsim.RandomCNTNetwork(n=n,scaling=scaling,notes='run',l=l,seed=seed,onoffmap=onoffmap,element=element,cache=cache,solver=solver,tol=tol,preconditioner=preconditioner,periodic=periodic)
     if v:
         print("=== physical device made t = {:0.2}".format(timer()-start))
         print("percolating : {}".format(device.percolating))
+        if device.percolating:
+            print("solver : {}".format(device.cnet.solver_info))
     # cluster information collected
     device.label_clusters()
-    nclust=len(device.sticks.cluster.drop_duplicates())
-    try:
-        maxclust=len(max(nx.connected_components(device.graph)))
-    except:
-        maxclust=0
+    nclust=len(np.unique(device.sticks.cluster))
+    if ckpt and 'maxclust' in ckpt.info:
+        maxclust=ckpt.info['maxclust']
+    else:
+        try:
+            maxclust=len(max(nx.connected_components(device.graph)))
+        except:
+            maxclust=0
     if v:
         print("=== cluster info collected t = {:0.2}".format(timer()-start))
 
 
+    # writes are queued on the writer thread if there is one
+    if writer:
+        save=writer.submit
+    else:
+        save=lambda f,*args,**kwargs: f(*args,**kwargs)
+
     # dump full device system of sticks and intersects
     if dump:
         try:
-            device.save_system(fname)
+            save(device.save_system,fname,compress=compress)
         except Exception as e:
             if v:
                 print("measurement failed: error saving data")
@@ -95,20 +288,36 @@ def single_measure(n,scaling,l='exp', dump=False, savedir='test', seed=0, onoffm
             print("=== device dump complete t = {:0.2}".format(timer()-start))
 
 
+    # graph statistics of the ungated network, see netstats.py
+    if stats:
+        if ckpt and 'netinfo' in ckpt.info:
+            netinfo=ckpt.info['netinfo']
+        elif device.percolating:
+            netinfo=netstats.network_stats(device.cnet,samples=stats,seed=seed)
+        else:
+            netinfo={c:np.nan for c in netstats.statcols}
+        if v:
+            print("=== graph info complete t = {:0.2}".format(timer()-start))
+    if ckpt:
+        ckpt.info['maxclust']=maxclust
+        if stats:
+            ckpt.info['netinfo']=netinfo
+        ckpt.save()
+
     # perform gate voltage sweeps on all gate configurations
     if device.percolating:
-        data=add_voltagemeas(device, data, vgrange=vgrange, vgnum=vgnum)
+        # node voltages and edge currents of every solve, see fielddata.py
+        fieldwriter=None
+        if fields:
+            frames=ckpt.state['frames'] if ckpt and ckpt.resumed else None
+            fieldwriter=FieldWriter(fname+"_fields", device.cnet, {g:capacity for g in ('back','partial','total')}, scaling=scaling, frames=frames)
+        data=add_voltagemeas(device, data, vgrange=vgrange, vgnum=vgnum, vgtol=vgtol, maxsolves=maxsolves, fields=fieldwriter, checkpoint=ckpt)
+        if fieldwriter:
+            fieldwriter.close()
         if v:
             print("=== gate sweeps complete t = {:0.2}".format(timer()-start))
     else:
         data.current=[0]
-    # add network characteristics
-    # connectivity=nx.average_node_connectivity(device.graph)
-    # charpath=nx.average_shortest_path_length(device.graph)
-    # clustercoeff=nx.clustering(device.graph)
-    # if v:
-    #     print("=== graph info complete t = {:0.2}".format(timer()-start))
-
     # add parameters and constants to data
     data.sticks=n
     data.scaling=scaling
@@ -116,28 +325,120 @@ def single_measure(n,scaling,l='exp', dump=False, savedir='test', seed=0, onoffm
 
     data.nclust=nclust
     data.maxclust=maxclust
-
-    # data.charpath=charpath
-    # data.clustercoeff=clustercoeff
-    # data.connectivity=connectivity
+    if stats:
+        for c in netstats.statcols:
+            data[c]=netinfo[c]
 
     data.seed=seed
     data.element=element
     data.onoffmap=onoffmap
     data.fname=fname
+    data['periodic']=bool(periodic)
     if v:
         print("=== data added to frame t = {:0.2}".format(timer()-start))
     end = timer()
     runtime=end - start
+    if ckpt:
+        # includes the time spent before any restarts
+        runtime+=ckpt.previous
     data['runtime']=runtime
 
-    data.to_csv(fname+"_data.csv")
+    save(data.to_csv,fname+"_data.csv")
+    if ckpt:
+        save(ckpt.remove)
     if v:
         print("=== data saved t = {:0.2}".format(timer()-start))
         print("=== measurement done ===")
     return data,fname
 
+def measure_matrix(n, scaling, elements=elements, onoffmaps=[0], gates=('back', 'partial', 'total'), l='exp', dump=False, savedir='test', seed=0, v=False, vgrange=10, vgnum=3, cache=None, vgtol=0, maxsolves=0, solver='auto', tol=1e-10, preconditioner='jacobi', periodic=False):
+    """
+    Builds one device and evaluates every combination of conduction element
+    and onoffmap against it, sweeping each gate type over vg. The geometry,
+    percolation and conduction graph are built once and only the junction
+    elements are swapped between variants.
+
+    Args:
+      n: number of sticks
+      scaling: size of the square system to simulate, in um
+      elements: conduction element classes to evaluate
+      onoffmaps: onoffmaps to evaluate for each element, combinations the
+        element does not define are skipped
+      gates: gate types to sweep
+      vgtol, maxsolves: adaptive vg sampling, see add_voltagemeas
+      solver, tol, preconditioner, periodic: see
+        netsim.RandomConductingNetwork
+
+    Returns:
+        data with the columns of single_measure, one row per (element,
+        onoffmap, gate, vg), and the file name it was saved under. runtime is
+        the variant's own sweep time plus an equal share of the device build.
+    """
+    import pandas as pd
+    datacol=['sticks', 'scaling', 'density', 'current', 'gatevoltage','gate', 'nclust', 'maxclust', 'fname','onoffmap', 'seed', 'runtime', 'element', 'periodic', 'solver', 'iterations', 'residual']
+    checkdir(savedir)
+    start = timer()
+    d=n/scaling**2
+    # checked before any work is done
+    sweep_capacity(vgnum,vgtol,maxsolves)
+    if not(seed):
+        seed=np.random.randint(low=0,high=2**32)
+    fname=os.path.join(savedir,"mmat{:2.2f}_s{}_l{}_seed{:010d}{}".format(d,scaling,l,seed,"_periodic" if periodic else ""))
+    if v:
+        print("=== matrix measurement start ===\nn{:05d}_d{:2.1f}_seed{:010d}".format( n, d, seed))
+
+    # built with an element every onoffmap set defines, the variants are all
+    # applied below where invalid combinations are skipped
+    device=netsim.RandomCNTNetwork(n=n,scaling=scaling,notes='run',l=l,seed=seed,onoffmap=0,element=LinExpTransistor,cache=cache,solver=solver,tol=tol,preconditioner=preconditioner,periodic=periodic)
+    device.label_clusters()
+    nclust=len(np.unique(device.sticks.cluster))
+    maxclust=device.clustersizes.max() if len(device.clustersizes) else 0
+    if dump:
+        device.save_system(fname)
+    buildtime=timer()-start
+    if v:
+        print("=== device built, percolating : {} t = {:0.2}".format(device.percolating,buildtime))
+
+    variants=[(element,onoffmap) for element in elements for onoffmap in onoffmaps]
+    results=[]
+    for element,onoffmap in variants:
+        variantstart=timer()
+        data=pd.DataFrame(columns = datacol)
+        try:
+            device.set_element(element,onoffmap)
+        except (IndexError,KeyError) as e:
+            if v:
+                print("skipping {} with onoffmap {}: {!r}".format(element.__name__,onoffmap,e))
+            continue
+        if device.percolating:
+            data=add_voltagemeas(device, data, vgrange=vgrange, vgnum=vgnum, gates=gates, vgtol=vgtol, maxsolves=maxsolves)
+        else:
+            data.current=[0]
+        data.onoffmap=onoffmap
+        data.element=element
+        data['runtime']=timer()-variantstart
+        results.append(data)
+        if v:
+            print("=== {} onoffmap {} done t = {:0.2}".format(element.__name__,onoffmap,timer()-start))
+    data=pd.concat(results,ignore_index=True)
+    data['runtime']+=buildtime/len(results)
+    data.sticks=n
+    data.scaling=scaling
+    data.density=d
+    data.nclust=nclust
+    data.maxclust=maxclust
+    data.seed=seed
+    data.fname=fname
+    data['periodic']=bool(periodic)
+    data=data[datacol]
+    data.to_csv(fname+"_data.csv")
+    if v:
+        print("=== matrix measurement done t = {:0.2}".format(timer()-start))
+    return data,fname
+
 def measure_fullnet(n,scaling, l='exp', save=False, seed=0,onoffmap=1, v=False ,remote=False):
+    import pandas as pd
+    import networkx as nx
 
     datacol=['sticks', 'size', 'density', 'nclust', 'maxclust', 'ion', 'ioff','gate', 'fname','seed','onoffmap']
     start = timer()
@@ -145,7 +446,7 @@ def measure_fullnet(n,scaling, l='exp', save=False, seed=0,onoffmap=1, v=False ,
 
     collection=netsim.RandomConductingNetwork(n,scaling=scaling,notes='run',l=l,seed=seed,onoffmap=onoffmap)
     collection.label_clusters()
-    nclust=len(collection.sticks.cluster.drop_duplicates())
+    nclust=len(np.unique(collection.sticks.cluster))
     try:
         maxclust=len(max(nx.connected_components(collection.graph)))
     except:
@@ -218,6 +519,7 @@ def measure_async(cores, start, step, number, scaling, save=False, onoffmap=[1],
         all of the data collected from each simulation with columns:
         ['sticks', 'size', 'density', 'nclust', 'maxclust', 'ion', 'ioff','gate', 'fname','seed','onoffmap']
     """
+    import pandas as pd
     if os.path.isdir("data") == False:
         os.system("mkdir " + "data")
     uuid=id.uuid4()
@@ -241,11 +543,566 @@ def measure_async(cores, start, step, number, scaling, save=False, onoffmap=[1],
         data.to_csv('measurement_batch_{}.csv'.format(uuid))
     return data
 
+def percolation_probe(args):
+    """
+    Args:
+      args: (n, scaling, seed, tiles, periodic) of the network to generate
+
+    Returns:
+        whether the network percolates, checked without any MNA solve
+    """
+    n,scaling,seed,tiles,periodic=args
+    # throwaway networks, not worth a geometry cache entry each
+    device=netsim.RandomConductingNetwork(n=n,scaling=scaling,seed=seed,tiles=tiles,network=False,periodic=periodic,cache=False)
+    return device.percolating
+
+def _binomial_counts(density,percolating):
+    """distinct densities with the number of networks and of percolating ones"""
+    x,index=np.unique(np.asarray(density,dtype=float),return_inverse=True)
+    return x,np.bincount(index).astype(float),np.bincount(index,weights=np.asarray(percolating,dtype=float))
+
+def fit_logistic(density,percolating,iterations=50):
+    """
+    Maximum likelihood fit of P(percolating)=1/(1+exp(-b*(density-t))).
+
+    Returns:
+        threshold t, its standard error from the Fisher information, and b.
+        None while the samples are still separable and the fit does not exist.
+    """
+    from scipy.special import expit
+    y=np.asarray(percolating,dtype=float)
+    x=np.asarray(density,dtype=float)
+    # the fit diverges unless the outcomes overlap over a range of densities
+    if not (y.min()<y.max()) or x[y==0].max()<=x[y==1].min():
+        return None
+    x,m,k=_binomial_counts(x,y)
+    # centred and scaled for conditioning, logit = a + b*u
+    centre=(m*x).sum()/m.sum()
+    span=np.sqrt((m*(x-centre)**2).sum()/m.sum()) or 1
+    u=(x-centre)/span
+    X=np.stack([np.ones_like(u),u],axis=1)
+    beta=np.zeros(2)
+    for i in range(iterations):
+        p=expit(X.dot(beta))
+        # a small ridge keeps the step defined when few densities are sampled
+        info=(X*(m*p*(1-p))[:,None]).T.dot(X)+1e-6*np.eye(2)
+        step=np.linalg.solve(info,X.T.dot(k-m*p)-1e-6*beta)
+        beta+=step
+        if np.abs(step).max()<1e-10:
+            break
+    a,b=beta
+    if not b>0:
+        return None
+    p=expit(X.dot(beta))
+    cov=np.linalg.inv((X*(m*p*(1-p))[:,None]).T.dot(X)+1e-6*np.eye(2))
+    # threshold u=-a/b, by the delta method
+    grad=np.array([-1/b,a/b**2])
+    stderr=np.sqrt(grad.dot(cov).dot(grad))*span
+    return centre-a/b*span, stderr, b/span
+
+def profile_loglike(density,percolating,threshold,b=1.,iterations=50):
+    """
+    Log likelihood of the logistic fit with its threshold held at threshold,
+    maximised over the slope b, starting from b.
+    """
+    from scipy.special import expit
+    x,m,k=_binomial_counts(density,percolating)
+    u=x-threshold
+    def loglike(b):
+        return -(k*np.logaddexp(0,-b*u)+(m-k)*np.logaddexp(0,b*u)).sum()
+    current=loglike(b)
+    for i in range(iterations):
+        p=expit(b*u)
+        step=(u*(k-m*p)).sum()/((m*p*(1-p)*u**2).sum()+1e-12)
+        # the log likelihood is concave in b, halve steps that overshoot
+        while loglike(b+step)<current and abs(step)>1e-12:
+            step/=2
+        b+=step
+        current=loglike(b)
+        if abs(step)<1e-10*max(abs(b),1):
+            break
+    return current
+
+def profile_interval(density,percolating,fit,z,lo,hi):
+    """
+    Profile likelihood confidence interval of the threshold, the thresholds
+    whose log likelihood maximised over b is within z**2/2 of the maximum.
+    Unlike the delta method interval of fit_logistic it widens while b is
+    poorly known, as when the samples span less than a logistic width.
+    Bounds beyond [lo, hi] are returned as lo or hi.
+    """
+    from scipy.optimize import brentq
+    threshold,stderr,b=fit
+    best=profile_loglike(density,percolating,threshold,b)
+    def excess(t):
+        return 2*(best-profile_loglike(density,percolating,t,b))-z**2
+    bounds=[]
+    for end in (min(lo,threshold),max(hi,threshold)):
+        if excess(end)<=0:
+            bounds.append(end)
+        else:
+            bounds.append(brentq(excess,threshold,end,xtol=1e-6))
+    return bounds
+
+def find_threshold(scaling, lo, hi, precision=0.05, confidence=0.95, min_samples=100, min_densities=5, max_samples=10000, cores=1, tiles=0, seeds=None, v=False, periodic=False):
+    """
+    Locates the density (sticks/um^2) at which half of the networks percolate
+    using only percolation checks. Samples are placed by bisection on the gap
+    between percolating and non percolating densities until both outcomes
+    overlap, then alternately at the current maximum likelihood threshold,
+    where each network tells the most about it, and at two logistic widths
+    either side of it, which keeps the fitted width honest. Sampling stops
+    once the profile likelihood interval is narrower than +-precision or
+    after max_samples networks, with a warning. At least min_samples networks
+    at min_densities densities are always generated, as the interval of a
+    fit to a few nearly separable samples is far too optimistic. Stopping at
+    the first narrow enough interval leaves a 95% interval covering the
+    threshold around 93% of the time. The interval narrows as 1/sqrt(samples)
+    and is widest for small devices with their broad transitions, +-0.05
+    sticks/um^2 at 5 um taking around 10000 samples.
+
+    Args:
+      scaling: size of the square system to simulate, in um
+      lo: density assumed not to percolate
+      hi: density assumed to percolate
+      precision: target half width of the confidence interval, in sticks/um^2
+      confidence: confidence level of the interval
+      min_samples: minimum number of networks to generate
+      min_densities: minimum number of distinct densities sampled
+      max_samples: maximum number of networks to generate
+      cores: number of networks generated in parallel per step
+      tiles, periodic: passed to netsim.RandomConductingNetwork
+      seeds: optional iterable of seeds, otherwise random
+
+    Returns:
+        dict of threshold, ci_low, ci_high, samples, whether the interval
+        converged to precision and the sampled density and percolating arrays
+    """
+    from scipy.stats import norm
+    z=norm.ppf(0.5+confidence/2)
+    if seeds is None:
+        seeds=iter(np.random.randint(low=1,high=2**32,size=max_samples))
+    else:
+        seeds=iter(seeds)
+    pool=Pool(cores) if cores>1 else None
+    density=[]
+    percolating=[]
+    fit=None
+    side=1
+    step=0
+    converged=False
+    while len(density)<max_samples:
+        fit=fit_logistic(density,percolating) if density else None
+        if fit is None:
+            # bisect the gap between the densest non percolating sample and
+            # the sparsest percolating one, spread over the gap with several
+            # cores. Densities are whole numbers of sticks, so once no count
+            # is left inside the gap its ends are resampled instead, or the
+            # counts either side if both outcomes share one, until the
+            # outcomes overlap.
+            below=[d for d,p in zip(density,percolating) if not p]
+            above=[d for d,p in zip(density,percolating) if p]
+            nlo,nhi=[int(round(d*scaling**2)) for d in (max(below+[lo]),min(above+[hi]))]
+            if nhi-nlo>1:
+                points=list(np.linspace(nlo,nhi,cores+2)[1:-1]/scaling**2)
+            else:
+                points=[]
+                for i in range(cores):
+                    points.append((nhi+(nlo==nhi) if side>0 else nlo-(nlo==nhi))/scaling**2)
+                    side=-side
+        else:
+            threshold,stderr,b=fit
+            # the delta method interval is cheap but too narrow while b is
+            # poorly known, so it only screens for the profile interval
+            if z*stderr<precision and len(density)>=min_samples and len(set(density))>=min_densities:
+                ci=profile_interval(density,percolating,fit,z,lo,hi)
+                if max(threshold-ci[0],ci[1]-threshold)<precision:
+                    converged=True
+                    break
+            # every other sample is two logistic widths, and at least one
+            # stick, to one side. Without them the slope is only set by the
+            # nearly separable samples of the bisection, too steep, and the
+            # samples closing in on the threshold would never correct it.
+            centre=int(round(threshold*scaling**2))
+            width=max(1,int(round(2*scaling**2/b)))
+            points=[]
+            for i in range(cores):
+                offset=0 if step%2==0 else side*width
+                points.append(min(max((centre+offset)/scaling**2,lo),hi))
+                side=-side if step%2 else side
+                step+=1
+        tasks=[(int(round(d*scaling**2)),scaling,next(seeds),tiles,periodic) for d in points]
+        results=pool.map(percolation_probe,tasks) if pool else [percolation_probe(t) for t in tasks]
+        density+=[t[0]/scaling**2 for t in tasks]
+        percolating+=list(results)
+        if v and fit is not None:
+            print("samples {:5d}: threshold {:.4f} \u00b1 {:.4f}".format(len(density),fit[0],z*fit[1]))
+    if pool:
+        pool.close()
+    fit=fit_logistic(density,percolating)
+    if fit is None:
+        threshold,ci=np.nan,[np.nan,np.nan]
+    else:
+        threshold=fit[0]
+        ci=profile_interval(density,percolating,fit,z,lo,hi)
+    halfwidth=max(threshold-ci[0],ci[1]-threshold)
+    # the last fit may be of fewer samples than the budget allows
+    converged=converged or (halfwidth<precision and len(density)>=min_samples and len(set(density))>=min_densities)
+    if not converged:
+        print("WARNING: threshold at {} um stopped at max_samples {} with CI +-{:.4f}, above the precision {}".format(scaling,max_samples,halfwidth,precision))
+    return {'scaling':scaling, 'threshold':threshold, 'ci_low':ci[0], 'ci_high':ci[1], 'confidence':confidence, 'samples':len(density), 'converged':converged, 'density':np.array(density), 'percolating':np.array(percolating)}
+
+def _number(value):
+    value=float(value)
+    return int(value) if value.is_integer() else value
+
+def read_manifest(path):
+    """
+    Args:
+      path: csv file with a header row and the columns n, scaling, seed,
+        onoffmap and element, where element is an index into elements
+
+    Returns:
+        list of single_measure keyword arguments, one dict per row
+    """
+    with open(path) as f:
+        rows=list(csv.DictReader(f))
+    return [dict(n=int(row['n']), scaling=_number(row['scaling']), seed=int(row['seed']), onoffmap=int(row['onoffmap']), element=elements[int(row['element'])]) for row in rows]
+
+def _batch_measure(kwargs):
+    try:
+        return single_measure(**kwargs)
+    except Exception as e:
+        print("measurement failed for {}:\n".format(kwargs),e)
+        traceback.print_exc(file=sys.stdout)
+        return None
+
+def measure_batch(manifest, cores=1, pipeline=False, **kwargs):
+    """
+    Runs single_measure for every row of a manifest in one warm process (or a
+    pool of cores processes), so that interpreter startup and imports are paid
+    once per job rather than once per measurement.
+
+    Args:
+      manifest: path of the manifest, see read_manifest
+      cores: number of processes to spread the rows over
+      pipeline: run the rows through measure_pipeline instead, in a single
+        measuring process, ignoring cores
+      **kwargs: further single_measure arguments shared by all rows, such as
+        savedir, dump, vgrange, vgnum and vgtol
+
+    Returns:
+        list of (data, fname) from single_measure, None for failed rows
+    """
+    if pipeline:
+        return measure_pipeline(read_manifest(manifest), **kwargs)[0]
+    jobs=[]
+    for row in read_manifest(manifest):
+        job=dict(kwargs)
+        job.update(row)
+        jobs.append(job)
+    if cores>1:
+        pool=Pool(cores)
+        output=pool.map(_batch_measure,jobs,chunksize=1)
+        pool.close()
+    else:
+        output=[_batch_measure(job) for job in jobs]
+    return output
+
+class BackgroundWriter(object):
+    """
+    Runs file writes in order on a background thread, so that serialization
+    overlaps with the numerical work of the calling thread. submit blocks
+    while queue_size writes are already waiting, which bounds the memory held
+    by pending data. busy is the time spent writing and blocked the time the
+    caller spent waiting on the queue, including the final close.
+    """
+    def __init__(self,queue_size=4):
+        import threading, queue
+        self.queue=queue.Queue(maxsize=queue_size)
+        self.busy=0.
+        self.blocked=0.
+        self.errors=0
+        self.thread=threading.Thread(target=self._run,daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            task=self.queue.get()
+            if task is None:
+                break
+            f,args,kwargs=task
+            start=timer()
+            try:
+                f(*args,**kwargs)
+            except Exception as e:
+                self.errors+=1
+                print("background write failed:",e)
+                traceback.print_exc(file=sys.stdout)
+            self.busy+=timer()-start
+
+    def submit(self,f,*args,**kwargs):
+        start=timer()
+        self.queue.put((f,args,kwargs))
+        self.blocked+=timer()-start
+
+    def close(self):
+        start=timer()
+        self.queue.put(None)
+        self.thread.join()
+        self.blocked+=timer()-start
+
+def _prefetch_geometry(job,cachedir):
+    """generates and caches the geometry single_measure(**job) will use,
+    returning the time taken"""
+    start=timer()
+    netsim.RandomConductingNetwork(n=job['n'], scaling=job['scaling'], l=job.get('l','exp'), seed=job['seed'], network=False, cache=cachedir, periodic=job.get('periodic',False))
+    return timer()-start
+
+def measure_pipeline(rows, cache=None, queue_size=4, **kwargs):
+    """
+    Runs single_measure for each row with the stages of consecutive
+    measurements overlapped: while one device is swept, the geometry and
+    percolation of the next are generated in a second process and stored in
+    the geometry cache, and dumps and data files are written by a
+    BackgroundWriter thread.
+
+    Args:
+      rows: list of single_measure keyword arguments, as from read_manifest.
+        Rows without a seed are given one so that the prefetched geometry
+        matches.
+      cache: geometry cache shared with the generating process, see
+        geomcache.get_cache. A temporary one is used if there is none.
+      queue_size: number of pending writes before the measurement waits
+      **kwargs: further single_measure arguments shared by all rows, with v
+        also reporting the overlap achieved
+
+    Returns:
+        list of (data, fname) from single_measure, None for failed rows, and
+        a dict of the time spent generating and writing in the background,
+        the time the measurements waited on each, and the overall wall time
+    """
+    cache=geomcache.get_cache(cache)
+    tmpdir=None
+    if cache is None:
+        tmpdir=tempfile.mkdtemp(prefix='netsim_pipeline')
+        cache=geomcache.GeometryCache(tmpdir)
+    jobs=[]
+    for row in rows:
+        job=dict(kwargs)
+        job.update(row)
+        if not job.get('seed'):
+            job['seed']=int(np.random.randint(low=1,high=2**32))
+        jobs.append(job)
+    start=timer()
+    generator=Pool(1)
+    writer=BackgroundWriter(queue_size)
+    generating=0.
+    waited=0.
+    output=[]
+    if jobs:
+        prefetch=generator.apply_async(_prefetch_geometry,(jobs[0],cache.directory))
+    for i,job in enumerate(jobs):
+        wait=timer()
+        try:
+            generating+=prefetch.get()
+        except Exception as e:
+            # single_measure generates the geometry itself instead
+            print("geometry prefetch failed:",e)
+        waited+=timer()-wait
+        if i+1<len(jobs):
+            prefetch=generator.apply_async(_prefetch_geometry,(jobs[i+1],cache.directory))
+        output.append(_batch_measure(dict(job,cache=cache,writer=writer)))
+    generator.close()
+    generator.join()
+    writer.close()
+    if tmpdir:
+        shutil.rmtree(tmpdir,ignore_errors=True)
+    overlap={'wall':timer()-start, 'generating':generating, 'generation_wait':waited, 'writing':writer.busy, 'write_wait':writer.blocked}
+    if kwargs.get('v'):
+        # the writer thread still shares the interpreter lock with the
+        # measurement, so time not waited on is not all saved wall time
+        print("=== pipeline of {} measurements done in {:.1f} s".format(len(jobs),overlap['wall']))
+        print("generation {:.1f} s in the background, {:.1f} s waited on".format(generating,waited))
+        print("writing {:.1f} s in the background, {:.1f} s waited on".format(writer.busy,writer.blocked))
+    return output,overlap
+
+class RunningStats(object):
+    """Online mean and variance by Welford's algorithm"""
+    def __init__(self):
+        self.n=0
+        self.mean=0.
+        self.m2=0.
+
+    def add(self,x):
+        self.n+=1
+        delta=x-self.mean
+        self.mean+=delta/self.n
+        self.m2+=delta*(x-self.mean)
+
+    @property
+    def var(self):
+        return self.m2/(self.n-1) if self.n>1 else np.nan
+
+    def halfwidth(self,confidence=0.95):
+        """half width of the student t confidence interval of the mean"""
+        from scipy.stats import t
+        if self.n<2:
+            return np.inf
+        return t.ppf(0.5+confidence/2,self.n-1)*np.sqrt(self.var/self.n)
+
+    def proportion_halfwidth(self,confidence=0.95):
+        """half width of the Wilson score interval, for means of 0/1 samples,
+        which unlike the t interval does not vanish when every sample agrees"""
+        from scipy.stats import norm
+        if not self.n:
+            return np.inf
+        z=norm.ppf(0.5+confidence/2)
+        p=self.mean
+        return z*np.sqrt(p*(1-p)/self.n+z**2/(4*self.n**2))/(1+z**2/self.n)
+
+def replicate_values(data, gates=('back','partial','total')):
+    """percolation, and the log10 on/off ratio and on current of each gate,
+    from the data of one single_measure. On is the most negative vg and off
+    the most positive, as in viewnet.open_data."""
+    values={('percolating',None):float(data.gate.notna().any())}
+    for g in gates:
+        sweep=data[data.gate==g]
+        if len(sweep):
+            on=float(sweep.current[sweep.gatevoltage.idxmin()])
+            off=float(sweep.current[sweep.gatevoltage.idxmax()])
+            values[('logonoff',g)]=np.log10(on/off)
+            values[('current',g)]=on
+    return values
+
+def measure_adaptive(densities, scaling, cores=1, ptarget=0.1, onofftarget=0.1, currenttarget=0.05, confidence=0.95, min_reps=5, max_reps=200, gates=('back','partial','total'), savedir='test', v=False, **kwargs):
+    """
+    Measures replicate devices at each density until the statistics of
+    interest are known to the target precision, rather than a fixed number of
+    replicates per density. Running means and variances are kept for the
+    percolation probability of each density and for the log10 on/off ratio
+    and on current of each gate, over the percolating devices. Free cores are
+    given to the density whose widest confidence interval is furthest from
+    its target, allowing for the replicates already in flight.
+
+    A density is done once it has min_reps replicates and
+      - the percolation probability is within +-ptarget
+      - if any replicate percolated, the log10 on/off ratio of every gate is
+        within +-onofftarget decades and the on current within
+        +-currenttarget of its mean, with at least two percolating replicates
+    or once max_reps replicates have been made. The Wilson interval of a
+    density where every replicate (or none) percolates is z^2/(2n+2z^2)
+    wide, so such densities stop no sooner than 16 replicates at ptarget=0.1,
+    and 35 at 0.05. Replicates that fail count towards max_reps and are
+    reported in the summary.
+
+    Args:
+      densities: stick densities to measure, in sticks/um^2
+      scaling: size of the square system to simulate, in um
+      cores: number of measurements run in parallel
+      confidence: confidence level of the intervals
+      savedir: where single_measure saves each replicate, and where the
+        summary is saved as adaptive_summary.csv
+      **kwargs: further single_measure arguments, such as onoffmap, element,
+        vgrange and vgnum
+
+    Returns:
+        DataFrame with one row per density, quantity and gate of the number
+        of replicates, mean, standard deviation, confidence half width and
+        whether the target was reached, and of the number of failed replicates
+    """
+    import pandas as pd
+    import queue
+    checkdir(savedir)
+    stats={d:{} for d in densities}
+    made={d:0 for d in densities}
+    pending={d:0 for d in densities}
+    failed={d:0 for d in densities}
+    targets={'percolating':ptarget,'logonoff':onofftarget,'current':currenttarget}
+
+    def widths(d):
+        """confidence half width over target of each quantity of a density"""
+        out={}
+        for key,st in stats[d].items():
+            if key[0]=='percolating':
+                hw=st.proportion_halfwidth(confidence)
+            elif key[0]=='current':
+                hw=st.halfwidth(confidence)/abs(st.mean) if st.n>1 else np.inf
+            else:
+                hw=st.halfwidth(confidence)
+            out[key]=hw/targets[key[0]]
+        percolating=stats[d].get(('percolating',None))
+        if percolating and percolating.n*percolating.mean>0:
+            # on/off targets apply once a replicate percolated
+            for g in gates:
+                for q in ('logonoff','current'):
+                    out.setdefault((q,g),np.inf)
+        return out
+
+    def done(d):
+        if made[d]>=max_reps:
+            return True
+        ratios=widths(d)
+        return made[d]>=min_reps and bool(ratios) and max(ratios.values())<=1
+
+    def priority(d):
+        ratios=widths(d)
+        worst=max(ratios.values()) if ratios else np.inf
+        # the intervals shrink as 1/sqrt(n) with the replicates in flight
+        if np.isfinite(worst) and made[d]:
+            worst*=np.sqrt(made[d]/(made[d]+pending[d]))
+        return (made[d]<min_reps, worst, -(made[d]+pending[d]))
+
+    results=queue.Queue()
+    pool=Pool(cores)
+    start=timer()
+    while True:
+        while sum(pending.values())<cores:
+            open_points=[d for d in densities if not done(d) and made[d]+pending[d]<max_reps]
+            if not open_points:
+                break
+            d=max(open_points,key=priority)
+            job=dict(kwargs, n=int(round(d*scaling**2)), scaling=scaling, seed=int(np.random.randint(low=1,high=2**32)), savedir=savedir)
+            pending[d]+=1
+            # failures outside _batch_measure still have to free their slot
+            pool.apply_async(_batch_measure, (job,), callback=lambda output,d=d: results.put((d,output)), error_callback=lambda e,d=d: results.put((d,e)))
+        if not sum(pending.values()):
+            break
+        d,output=results.get()
+        pending[d]-=1
+        made[d]+=1
+        if isinstance(output,BaseException):
+            print("measurement failed at density {:g}:\n".format(d),output)
+            output=None
+        if output is None:
+            failed[d]+=1
+            continue
+        for key,value in replicate_values(output[0],gates).items():
+            if key[0]=='percolating' or np.isfinite(value):
+                stats[d].setdefault(key,RunningStats()).add(value)
+        if v:
+            ratios=widths(d)
+            print("density {:g}: {} replicates, widest interval {:.2f} of target t = {:.0f}".format(d,made[d],max(ratios.values()) if ratios else np.inf,timer()-start))
+    pool.close()
+    pool.join()
+
+    rows=[]
+    for d in densities:
+        ratios=widths(d)
+        for key,st in sorted(stats[d].items(),key=lambda item:(item[0][0],str(item[0][1]))):
+            hw=st.proportion_halfwidth(confidence) if key[0]=='percolating' else st.halfwidth(confidence)
+            rows.append([d,key[0],key[1],st.n,made[d],failed[d],st.mean,np.sqrt(st.var) if st.n>1 else np.nan,hw,ratios[key]<=1])
+        if not stats[d]:
+            rows.append([d,'percolating',None,0,made[d],failed[d],np.nan,np.nan,np.inf,False])
+    summary=pd.DataFrame(rows,columns=['density','quantity','gate','n','replicates','failed','mean','std','halfwidth','converged'])
+    summary.to_csv(os.path.join(savedir,'adaptive_summary.csv'),index=False)
+    return summary
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser( formatter_class=argparse.RawDescriptionHelpFormatter, description=__doc__)
-    parser.add_argument("function", type=str, choices=["multicore","singlecore"],
-        help="can be: %(choices)s. single core performs a single system generation and a range of gate voltage measurements. multicore performs system generation over a range of densities, and utilizes multiple cores.")
+    parser.add_argument("function", type=str, choices=["multicore","singlecore","batch","matrix","threshold","adaptive"],
+        help="can be: %(choices)s. single core performs a single system generation and a range of gate voltage measurements. multicore performs system generation over a range of densities, and utilizes multiple cores. batch performs a singlecore measurement for each row of --manifest in one process. matrix performs the singlecore gate sweeps for every --elements and --onoffmaps combination on a single system. threshold finds the percolation threshold density for each --scalings with percolation checks only. adaptive performs singlecore measurements at each --densities until the statistics reach the --ptarget, --onofftarget and --currenttarget precisions.")
     parser.add_argument("-d",'--directory',type=str,default='')
     parser.add_argument("-t",'--test',action="store_true",default=False, help = 'runs a minimal version of the function.')
     parser.add_argument('-s','--save',action="store_true",default=False, help = "Whether to save the whole network structure for later loading. WARNING: can generate very large saved files.")
@@ -260,6 +1117,32 @@ if __name__ == '__main__':
     parser.add_argument("--element",type=int,default=0, help="Conduction element to be used in the network. choose from :\n {}".format({0:FermiDiracTransistor,1:LinExpTransistor}))
     parser.add_argument("--vgrange",type=int,default=10,help ="the absolute value of the vg range. vgpoints=np.linspace(-vgrange,vgrange,vgnum)")
     parser.add_argument("--vgnum",type=int,default=3,help ="number of voltage points to measure within --vgrange. vgpoints=np.linspace(-vgrange,vgrange,vgnum)")
+    parser.add_argument("--vgtol",type=float,default=0,help ="if set, the --vgnum grid is refined wherever the current between neighbouring points changes by more than this many decades")
+    parser.add_argument("--maxsolves",type=int,default=0,help ="cap on solves per gate sweep with --vgtol, at least --vgnum, 0 for 4*vgnum")
+    parser.add_argument("--solver",type=str,default='auto',choices=solvers,help ="solver for the conduction network, see cnet.ConductionNetwork")
+    parser.add_argument("--tol",type=float,default=1e-10,help ="relative residual at which the cg and amg solvers stop")
+    parser.add_argument("--preconditioner",type=str,default='jacobi',choices=preconditioners,help ="preconditioner of the cg solver")
+    parser.add_argument("--fields",action="store_true",default=False,help ="store the node voltages and edge currents of every gate sweep point in a <fname>_fields dataset, see fielddata.py")
+    parser.add_argument("--stats",type=int,default=0,help ="if set, graph statistics (see netstats.py) are added to the data, sampling this many nodes for path lengths and clustering")
+    parser.add_argument("--checkpoint",nargs='?',const=True,default=False,help ="checkpoint singlecore measurements after every gate sweep point, and resume from an existing checkpoint. optionally the directory to keep checkpoints in, otherwise next to the data")
+    parser.add_argument("--elements",type=int,nargs='+',default=[0,1],help ="conduction elements evaluated by a matrix measurement, as for --element")
+    parser.add_argument("--onoffmaps",type=int,nargs='+',default=[0,1,2],help ="onoffmaps evaluated by a matrix measurement, as for --onoffmap")
+    parser.add_argument("--gates",type=str,nargs='+',default=['back','partial','total'],help ="gate types swept by a matrix measurement")
+    parser.add_argument("--scalings",type=float,nargs='+',default=[5],help ="system sizes in um to find the percolation threshold for")
+    parser.add_argument("--bracket",type=float,nargs=2,default=[2,12],help ="densities (sticks/um^2) below and above the percolation threshold")
+    parser.add_argument("--precision",type=float,default=0.05,help ="target half width of the threshold confidence interval, in sticks/um^2")
+    parser.add_argument("--maxsamples",type=int,default=10000,help ="maximum number of networks generated per threshold")
+    parser.add_argument("--densities",type=float,nargs='+',default=[],help ="stick densities (sticks/um^2) of an adaptive measurement")
+    parser.add_argument("--ptarget",type=float,default=0.1,help ="target confidence half width of the percolation probability, which takes at least 16 replicates at 0.1 and 35 at 0.05 where every device (or none) percolates")
+    parser.add_argument("--onofftarget",type=float,default=0.1,help ="target confidence half width of the log10 on/off ratio, in decades")
+    parser.add_argument("--currenttarget",type=float,default=0.05,help ="target confidence half width of the on current, relative to its mean")
+    parser.add_argument("--minreps",type=int,default=5,help ="minimum replicates per density of an adaptive measurement")
+    parser.add_argument("--maxreps",type=int,default=200,help ="maximum replicates per density of an adaptive measurement")
+    parser.add_argument("--pipeline",action="store_true",default=False,help ="batch measurements generate the next device while the current one is measured, and write files on a background thread")
+    parser.add_argument("--compress",action="store_true",default=False,help ="gzip the sticks and intersects saved with -s")
+    parser.add_argument("--periodic",action="store_true",default=False,help ="join the top and bottom (y) edges of the device, so that smaller devices behave like wider ones")
+    parser.add_argument("--cache",type=str,default=None,help ="directory of the generated geometry cache, defaults to $NETSIM_CACHE. see geomcache.py")
+    parser.add_argument("--manifest",type=str,default='',help ="csv file with columns n,scaling,seed,onoffmap,element, one batch measurement per row")
 
     args = parser.parse_args()
 
@@ -273,4 +1156,23 @@ if __name__ == '__main__':
         if args.test:
             single_measure(500,5,v=True)
         else:
-            single_measure(args.number, args.scaling, savedir=args.directory, dump=args.save, v=args.verbose, element = elements[args.element], onoffmap=args.onoffmap, seed=args.seed, vgrange=args.vgrange, vgnum=args.vgnum)
+            single_measure(args.number, args.scaling, savedir=args.directory, dump=args.save, compress=args.compress, v=args.verbose, element = elements[args.element], onoffmap=args.onoffmap, seed=args.seed, vgrange=args.vgrange, vgnum=args.vgnum, cache=args.cache, vgtol=args.vgtol, maxsolves=args.maxsolves, solver=args.solver, tol=args.tol, preconditioner=args.preconditioner, fields=args.fields, stats=args.stats, checkpoint=args.checkpoint, periodic=args.periodic)
+    elif args.function=="batch":
+        measure_batch(args.manifest, cores=args.cores, pipeline=args.pipeline, savedir=args.directory, dump=args.save, compress=args.compress, v=args.verbose, vgrange=args.vgrange, vgnum=args.vgnum, cache=args.cache, vgtol=args.vgtol, maxsolves=args.maxsolves, solver=args.solver, tol=args.tol, preconditioner=args.preconditioner, fields=args.fields, stats=args.stats, periodic=args.periodic)
+    elif args.function=="threshold":
+        rows=[]
+        for scaling in args.scalings:
+            result=find_threshold(scaling, args.bracket[0], args.bracket[1], precision=args.precision, max_samples=args.maxsamples, cores=args.cores, v=args.verbose, periodic=args.periodic)
+            print("{} um: threshold {:.4f} sticks/um^2, {:.0f}% CI [{:.4f}, {:.4f}] from {} networks".format(scaling, result['threshold'], 100*result['confidence'], result['ci_low'], result['ci_high'], result['samples']))
+            rows.append([result[k] for k in ['scaling','threshold','ci_low','ci_high','confidence','samples','converged']])
+        if args.save:
+            checkdir(args.directory)
+            np.savetxt(os.path.join(args.directory,'threshold.csv'), rows, delimiter=',', fmt='%g', header='scaling,threshold,ci_low,ci_high,confidence,samples,converged', comments='')
+    elif args.function=="adaptive":
+        summary=measure_adaptive(args.densities, args.scaling, cores=args.cores, ptarget=args.ptarget, onofftarget=args.onofftarget, currenttarget=args.currenttarget, min_reps=args.minreps, max_reps=args.maxreps, savedir=args.directory, v=args.verbose, element=elements[args.element], onoffmap=args.onoffmap, vgrange=args.vgrange, vgnum=args.vgnum, cache=args.cache, vgtol=args.vgtol, maxsolves=args.maxsolves, solver=args.solver, tol=args.tol, preconditioner=args.preconditioner, periodic=args.periodic)
+        print(summary.to_string())
+    elif args.function=="matrix":
+        if args.test:
+            measure_matrix(500,5,v=True)
+        else:
+            measure_matrix(args.number, args.scaling, elements=[elements[i] for i in args.elements], onoffmaps=args.onoffmaps, gates=args.gates, savedir=args.directory, dump=args.save, v=args.verbose, seed=args.seed, vgrange=args.vgrange, vgnum=args.vgnum, cache=args.cache, vgtol=args.vgtol, maxsolves=args.maxsolves, solver=args.solver, tol=args.tol, preconditioner=args.preconditioner, periodic=args.periodic)
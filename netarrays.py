@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+    File name: netarrays.py
+    Author: Leo Browning
+    email: leobrowning92@gmail.com
+    Date created: 19/10/2026 (DD/MM/YYYY)
+    Python Version: 3.5
+    Description:
+    Compact struct of arrays representation of sticks and intersects shared by
+    netsim.py, cnet.py and viewnet.py. Geometry is held in contiguous float
+    arrays (float32 optional), kinds as int8 codes and stick indices as int32.
+    DataFrames are only produced when saving, loading or for analysis.
+"""
+import numpy as np
+
+# stick kinds are coded by their position in stick_kinds, junction kinds as
+# 3*kind1+kind2, so that junction_kinds[code] is the two character name
+stick_kinds=['s','m','v']
+junction_kinds=[k1+k2 for k1 in stick_kinds for k2 in stick_kinds]
+
+def stick_codes(kinds):
+    """int8 codes of an iterable of stick kind names"""
+    lookup=np.zeros(128,dtype=np.int8)
+    for code,kind in enumerate(stick_kinds):
+        lookup[ord(kind)]=code
+    return lookup[np.array([ord(k) for k in kinds],dtype=np.int64)]
+
+def junction_codes(kinds):
+    """int8 codes of an iterable of junction kind names"""
+    kinds=list(kinds)
+    return (3*stick_codes([k[0] for k in kinds])+stick_codes([k[1] for k in kinds])).astype(np.int8)
+
+def stick_ends(xc,yc,angle,length):
+    """vectorized RandomConductingNetwork.get_ends, returns an (n,2,2) array"""
+    x1=xc-length/2*np.cos(angle)
+    x2=xc+length/2*np.cos(angle)
+    y1=yc+length/2*np.sin(angle)
+    y2=yc-length/2*np.sin(angle)
+    return np.stack([np.stack([x1,y1],axis=-1),np.stack([x2,y2],axis=-1)],axis=1)
+
+class StickArrays(object):
+    """Sticks as arrays xc, yc, angle, length, kind (int8 code) and cluster
+    (int32). ends is the (n,2,2) array of [[x1,y1],[x2,y2]], computed on first
+    use and kept in the geometry dtype."""
+    geometry=['xc','yc','angle','length']
+    def __init__(self,xc,yc,angle,length,kind,cluster=None,dtype=np.float64):
+        self.xc=np.ascontiguousarray(xc,dtype=dtype)
+        self.yc=np.ascontiguousarray(yc,dtype=dtype)
+        self.angle=np.ascontiguousarray(angle,dtype=dtype)
+        self.length=np.ascontiguousarray(length,dtype=dtype)
+        self.kind=np.ascontiguousarray(kind,dtype=np.int8)
+        if cluster is None:
+            cluster=np.arange(len(self.xc))
+        self.cluster=np.ascontiguousarray(cluster,dtype=np.int32)
+        self._ends=None
+
+    def __len__(self):
+        return len(self.xc)
+
+    @property
+    def dtype(self):
+        return self.xc.dtype
+
+    @property
+    def ends(self):
+        if self._ends is None:
+            self._ends=stick_ends(self.xc,self.yc,self.angle,self.length)
+        return self._ends
+
+    @property
+    def centers(self):
+        return np.stack([self.xc,self.yc],axis=1)
+
+    @property
+    def kind_names(self):
+        return np.array(stick_kinds)[self.kind]
+
+    def take(self,index):
+        """the sticks at index, in that order"""
+        return StickArrays(self.xc[index],self.yc[index],self.angle[index],self.length[index],self.kind[index],self.cluster[index],dtype=self.dtype)
+
+    def astype(self,dtype):
+        return StickArrays(self.xc,self.yc,self.angle,self.length,self.kind,self.cluster,dtype=dtype)
+
+    @classmethod
+    def concatenate(cls,sticks):
+        return cls(*[np.concatenate([getattr(s,c) for s in sticks]) for c in cls.geometry+['kind','cluster']],dtype=sticks[0].dtype)
+
+    def to_dataframe(self):
+        """DataFrame in the column layout netsim has always saved"""
+        import pandas as pd
+        return pd.DataFrame({"xc":self.xc, "yc":self.yc, "angle":self.angle, "length":self.length, 'kind':self.kind_names, "endarray":list(self.ends), 'cluster':self.cluster}, columns=[ "xc", "yc", "angle", "length",'kind', "endarray",'cluster'])
+
+    @classmethod
+    def from_dataframe(cls,df,dtype=np.float64):
+        cluster=df.cluster.values if 'cluster' in df else None
+        return cls(df.xc.values,df.yc.values,df.angle.values,df.length.values,stick_codes(df.kind.values),cluster,dtype=dtype)
+
+class IntersectArrays(object):
+    """Junctions between sticks as int32 stick1, stick2, positions x, y and
+    the int8 junction kind code"""
+    def __init__(self,stick1,stick2,x,y,kind,dtype=np.float64):
+        self.stick1=np.ascontiguousarray(stick1,dtype=np.int32)
+        self.stick2=np.ascontiguousarray(stick2,dtype=np.int32)
+        self.x=np.ascontiguousarray(x,dtype=dtype)
+        self.y=np.ascontiguousarray(y,dtype=dtype)
+        self.kind=np.ascontiguousarray(kind,dtype=np.int8)
+
+    def __len__(self):
+        return len(self.stick1)
+
+    @property
+    def dtype(self):
+        return self.x.dtype
+
+    @property
+    def pairs(self):
+        return np.stack([self.stick1,self.stick2],axis=1)
+
+    @property
+    def kind_names(self):
+        return np.array(junction_kinds)[self.kind]
+
+    def take(self,index):
+        return IntersectArrays(self.stick1[index],self.stick2[index],self.x[index],self.y[index],self.kind[index],dtype=self.dtype)
+
+    def astype(self,dtype):
+        return IntersectArrays(self.stick1,self.stick2,self.x,self.y,self.kind,dtype=dtype)
+
+    def to_dataframe(self):
+        import pandas as pd
+        return pd.DataFrame({"stick1":self.stick1,'stick2':self.stick2,'x':self.x,'y':self.y,'kind':self.kind_names}, columns=["stick1",'stick2','x','y','kind'])
+
+    @classmethod
+    def from_dataframe(cls,df,dtype=np.float64):
+        return cls(df.stick1.values,df.stick2.values,df.x.values,df.y.values,junction_codes(df.kind.values),dtype=dtype)
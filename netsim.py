@@ -9,22 +9,123 @@
     Core module which generates the physical network of sticks which is used to
     produce the electrical network. The total physical and electrical network is included in the RandomConductingNetwork class. the specific class RandomCNTNetwork is a special case of RandomConductingNetwork.
 """
-import argparse, os, time,traceback,sys
+import argparse, os, time,traceback,sys,inspect,hashlib
 import numpy as np
-import pandas as pd
-import matplotlib
-from cnet import ConductionNetwork, Resistor, FermiDiracTransistor, LinExpTransistor
-import networkx as nx
-import scipy.spatial as spatial
+import geomcache
+from cnet import ConductionNetwork, Resistor, FermiDiracTransistor, LinExpTransistor, lowrank_limit, check_solver
+from netarrays import StickArrays, IntersectArrays, stick_kinds
+# pandas, networkx and scipy.spatial are imported where they are used, so that
+# headless measurement processes (see measure_perc) start without paying for
+# them up front and never import matplotlib
 from timeit import default_timer as timer
 from datetime import datetime
+from multiprocessing import Pool
+
+# part of the geometry cache key along with a hash of the generator source, bump
+# it for changes that alter generated networks without touching that source
+GENERATOR_VERSION=1
+
+def segment_intersections(s1,s2):
+    """vectorized RandomConductingNetwork.check_intersect over two (n,2,2)
+    arrays of segment ends, with the same arithmetic so results match the
+    scalar version exactly. Returns xi, yi and a mask of intersecting pairs"""
+    with np.errstate(divide='ignore',invalid='ignore'):
+        #gradients
+        m1=(s1[:,0,1]-s1[:,1,1])/(s1[:,0,0]-s1[:,1,0])
+        m2=(s2[:,0,1]-s2[:,1,1])/(s2[:,0,0]-s2[:,1,0])
+        #intercepts
+        b1=s1[:,0,1]-m1*s1[:,0,0]
+        b2=s2[:,0,1]-m2*s2[:,0,0]
+        #xi,yi on both lines
+        xi=(b2-b1)/(m1-m2)
+        yi=(b2*m1-b1*m2)/(m1-m2)
+        mask=((m1!=m2)&
+              (s1[:,:,0].min(axis=1)<xi)&(xi<s1[:,:,0].max(axis=1))&
+              (s2[:,:,0].min(axis=1)<xi)&(xi<s2[:,:,0].max(axis=1)))
+    return xi,yi,mask
+
+def candidate_pairs(X,lengths,index,periodic=False):
+    """Pairs i,j of positions into X with index[i]<index[j] and centres within
+    lengths[i]. With sticks numbered in descending length, as
+    make_intersects_kdtree does, every crossing pair is a candidate. With
+    periodic, y distances are taken across the y=0/y=1 boundary as well."""
+    import scipy.spatial as spatial
+    if len(X)<2:
+        return np.zeros(0,dtype=int),np.zeros(0,dtype=int)
+    # a boxsize of 0 leaves x non periodic
+    tree=spatial.cKDTree(X,boxsize=[0,1]) if periodic else spatial.cKDTree(X)
+    neighbors=tree.query_ball_point(X,lengths)
+    counts=np.array([len(nb) for nb in neighbors])
+    i=np.repeat(np.arange(len(X)),counts)
+    j=np.concatenate(neighbors).astype(int)
+    # ensures no double counting and self counting
+    keep=index[i]<index[j]
+    return i[keep],j[keep]
+
+def periodic_intersections(ends,i,j,electrode):
+    """segment_intersections of the pairs i,j with periodic boundaries in y.
+    Each pair is tested with stick j and its images shifted by +-1 in y,
+    keeping the first crossing found, and the crossings are wrapped into
+    0<=y<1. The source and drain (electrode) span every y, so they would cross
+    all three images of a stick, and are only tested unshifted."""
+    xi=np.full(len(i),np.nan)
+    yi=np.full(len(i),np.nan)
+    mask=np.zeros(len(i),dtype=bool)
+    unshifted=electrode[i]|electrode[j]
+    for shift in (0,-1,1):
+        images=ends[j].copy()
+        images[:,:,1]+=shift
+        x,y,found=segment_intersections(ends[i],images)
+        found&=~mask
+        if shift:
+            found&=~unshifted
+        xi[found]=x[found]
+        yi[found]=y[found]
+        mask|=found
+    return xi,np.mod(yi,1),mask
+
+def _tile_intersects(task):
+    """intersections owned by one tile, ie. whose position lies in the
+    half open tile bounds. The sticks passed in are every stick whose bounding
+    box overlaps the tile, including the halo of sticks centred in other tiles
+    """
+    bounds,index,X,lengths,ends,kinds=task
+    i,j=candidate_pairs(X,lengths,index)
+    xi,yi,mask=segment_intersections(ends[i],ends[j])
+    x0,x1,y0,y1,lastx,lasty=bounds
+    inx=(x0<=xi)&((xi<x1)|(lastx&(xi<=x1)))
+    iny=(y0<=yi)&((yi<y1)|(lasty&(yi<=y1)))
+    mask&=inx&iny&(0<=xi)&(xi<=1)&(0<=yi)&(yi<=1)
+    i,j=i[mask],j[mask]
+    pairs=np.stack([index[i],index[j]],axis=1)
+    return pairs,np.stack([xi[mask],yi[mask]],axis=1),3*kinds[i]+kinds[j]
 
 class RandomConductingNetwork(object):
     """
 
     """
     def __init__(self, n=2,scaling=5, l='exp', pm=0.135 , fname='', directory='data', notes='', seed=0,
-    onoffmap=0, element = LinExpTransistor):
+    onoffmap=0, element = LinExpTransistor, tiles=0, workers=1, dtype=np.float64, cache=None, network=True, solver='auto', tol=1e-10, preconditioner='jacobi', periodic=False):
+        """with tiles>0 the sticks are generated and intersected on a tiles x
+        tiles grid using workers processes, see make_sticks_tiled. The result
+        depends on the seed and tiles but not on workers.
+
+        sticks and intersects are held as netarrays.StickArrays and
+        IntersectArrays, with geometry stored as dtype (np.float32 halves it)
+        once the intersections have been found in double precision.
+
+        Generated networks are reused from the geometry cache given by cache,
+        see geomcache.get_cache, which by default is the NETSIM_CACHE
+        directory if that environment variable is set.
+
+        With network=False only percolation is checked, no graph or conduction
+        network is built, see check_percolation. solver, tol and
+        preconditioner are passed to cnet.ConductionNetwork, and checked
+        before the network is generated.
+
+        With periodic the boundaries at y=0 and y=1 are joined, so sticks
+        crossing them connect to the sticks at the other side rather than
+        being cut off, see make_intersects_kdtree. Not supported with tiles."""
         self.scaling=scaling
         self.n=n
         self.pm=pm
@@ -34,6 +135,15 @@ class RandomConductingNetwork(object):
         self.percolating=False
         self.onoffmap=onoffmap
         self.element=element
+        self.tiles=tiles
+        self.dtype=dtype
+        check_solver(solver,preconditioner)
+        self.solver=solver
+        self.tol=tol
+        self.preconditioner=preconditioner
+        if periodic and tiles:
+            raise ValueError('periodic boundaries are not supported with tiles')
+        self.periodic=periodic
         #seeds are included to ensure proper randomness on distributed computing
         if seed:
             self.seed=seed
@@ -42,14 +152,45 @@ class RandomConductingNetwork(object):
         np.random.seed(self.seed)
 
         if not(fname):
-            self.sticks, self.intersects  = self.make_intersects_kdtree( self.make_sticks(n, l=l, pm=pm, scaling=scaling))
-            self.make_cnet()
+            self.cache=geomcache.get_cache(cache)
+            entry=None
+            if self.cache:
+                key=self.cache.key(seed=int(self.seed), n=n, scaling=scaling, l=l, pm=pm, tiles=tiles, dtype=np.dtype(dtype).name, periodic=bool(periodic), version=self.generator_version())
+                entry=self.cache.get(key)
+            if entry:
+                self.sticks, self.intersects, cluster = entry
+            else:
+                self.sticks, self.intersects = self.make_geometry(workers)
+                cluster=None
+            if network:
+                self.make_cnet(cluster)
+            else:
+                self.check_percolation(cluster)
+            if self.cache and not entry:
+                self.cache.put(key, self.sticks, self.intersects, self.spanning_cluster)
             self.fname=self.make_fname()
         else:
             self.fname=fname
             self.load_system(os.path.join(directory,fname))
 
+    def make_geometry(self,workers=1):
+        """sticks and intersects for the network parameters and seed"""
+        if self.tiles:
+            sticks, intersects = self.make_intersects_tiled( self.make_sticks_tiled(self.n, self.tiles, l=self.l, pm=self.pm, scaling=self.scaling), self.tiles, workers)
+        else:
+            sticks, intersects = self.make_intersects_kdtree( self.make_sticks(self.n, l=self.l, pm=self.pm, scaling=self.scaling), periodic=self.periodic)
+        return sticks.astype(self.dtype), intersects.astype(self.dtype)
+
+    def generator_version(self):
+        """GENERATOR_VERSION and a hash of the code that generates networks,
+        so cached networks are invalidated whenever that code changes"""
+        import netarrays
+        code=[RandomConductingNetwork.make_geometry, RandomConductingNetwork.make_sticks, RandomConductingNetwork.make_intersects_kdtree, RandomConductingNetwork.make_sticks_tiled, RandomConductingNetwork.make_intersects_tiled, RandomConductingNetwork.stick_components, RandomConductingNetwork.check_percolation, candidate_pairs, segment_intersections, periodic_intersections, _tile_intersects, netarrays]
+        source=''.join(inspect.getsource(c) for c in code)
+        return '{}-{}'.format(GENERATOR_VERSION,hashlib.sha256(source.encode()).hexdigest()[:16])
+
     def get_info(self):
+        import networkx as nx
         print('=== input parameters ===')
         print('number of sticks: {}'.format(self.n))
         print('stick length : {} \u00b1 {} \u03bcm'.format(0.66,0.44))
@@ -116,104 +257,207 @@ class RandomConductingNetwork(object):
         stick.append(self.get_ends(stick))
         return stick
 
-    def make_sticks(self, n,**kwargs):
-        # adds a vertical source and drain stick on left and right respectively
-        source=[0.01, 0.5,np.pi/2-1e-6,100,'v']
-        source.append(self.get_ends(source))
-        drain=[.99, 0.5,np.pi/2-1e-6,100,'v']
-        drain.append(self.get_ends(drain))
-        return pd.DataFrame( [source]+[self.make_stick(**kwargs) for i in range(n)]+[drain] ,columns=[ "xc", "yc", "angle", "length",'kind', "endarray"])
-        # return pd.DataFrame( [self.make_stick(**kwargs) for i in range(n)] ,columns=[ "xc", "yc", "angle", "length",'kind', "endarray"])
-
-
-
-
-    def make_intersects_kdtree(self,sticks):
-        sticks['cluster']=sticks.index
-        sticks.sort_values('length',inplace=True,ascending=False)
-        sticks.reset_index(drop=True,inplace=True)
-        intersects=[]
-        X=sticks.loc[:,'xc':'yc'].values
-        endpoints=sticks.endarray.values
-        kinds=sticks.kind.values
-        lengths=sticks.length.values
-        tree=spatial.KDTree(X)
-        for i in range(len(sticks)):
-            neighbors = tree.query_ball_point(X[i],lengths[i])
-            for j in neighbors:
-                # ensures no double counting and self counting
-                if i<j:
-                    intersection=self.check_intersect(endpoints[i],endpoints[j])
-                    if intersection and 0<=intersection[0]<=1 and 0<=intersection[1]<=1:
-                        intersects.append([i,j,*intersection, kinds[i]+kinds[j]],)
-        intersects=pd.DataFrame(intersects, columns=["stick1",'stick2','x','y','kind'])
-        return sticks, intersects
+    def make_sticks(self, n,l=None,pm=0,scaling=1):
+        """StickArrays of n sticks between a vertical source and drain stick on
+        the left and right respectively. Random numbers are drawn per stick in
+        the same order as make_stick, so seeds reproduce the same sticks."""
+        rand=np.random.rand
+        geometry=np.empty((n+2,4))
+        kind=np.zeros(n+2,dtype=np.int8)
+        geometry[0]=[0.01, 0.5,np.pi/2-1e-6,100]
+        geometry[n+1]=[.99, 0.5,np.pi/2-1e-6,100]
+        kind[[0,n+1]]=stick_kinds.index('v')
+        metallic=stick_kinds.index('m')
+        for i in range(1,n+1):
+            if rand()<=pm:
+                kind[i]=metallic
+            if type(l)!=str:
+                geometry[i]=[rand(), rand(), rand()*2*np.pi, l/scaling]
+            elif l=='exp':
+                geometry[i]=[rand(), rand(), rand()*2*np.pi, abs(np.random.normal(0.66,0.44))/scaling]
+            else:
+                raise ValueError('invalid L value')
+        return StickArrays(*geometry.T,kind=kind)
+
+    def make_intersects_kdtree(self,sticks,periodic=False):
+        """Renumbers the sticks in descending length, keeping their original
+        number in cluster, and finds every intersection inside the unit
+        square. With periodic, y is periodic and the intersections of sticks
+        that cross y=0 or y=1 with the images of other sticks are included,
+        wrapped into the unit square, see periodic_intersections. Returns the
+        renumbered StickArrays and the IntersectArrays."""
+        sticks.cluster=np.arange(len(sticks),dtype=np.int32)
+        # descending length with ties ordered as pandas sort_values(ascending=False)
+        # ordered them, so existing seeds keep their stick numbering
+        reverse=np.arange(len(sticks))[::-1]
+        sticks=sticks.take(reverse[sticks.length[::-1].argsort(kind='quicksort')][::-1])
+        ends=sticks.ends.astype(float)
+        i,j=candidate_pairs(sticks.centers.astype(float),sticks.length.astype(float),np.arange(len(sticks)),periodic=periodic)
+        if periodic:
+            xi,yi,mask=periodic_intersections(ends,i,j,sticks.kind==stick_kinds.index('v'))
+        else:
+            xi,yi,mask=segment_intersections(ends[i],ends[j])
+        mask&=(0<=xi)&(xi<=1)&(0<=yi)&(yi<=1)
+        i,j=i[mask],j[mask]
+        order=np.lexsort((j,i))
+        i,j=i[order],j[order]
+        return sticks, IntersectArrays(i,j,xi[mask][order],yi[mask][order],3*sticks.kind[i]+sticks.kind[j])
+
+    def make_sticks_tiled(self, n, tiles, l='exp', pm=0, scaling=1):
+        """Generates the same kind of system as make_sticks on a tiles x tiles
+        grid, each tile drawing its sticks from its own independent stream
+        spawned from the seed with np.random.SeedSequence. The number of sticks
+        per tile is multinomial, so sticks are uniform over the whole domain.
+        """
+        streams=np.random.SeedSequence(self.seed).spawn(tiles**2+1)
+        counts=np.random.default_rng(streams[0]).multinomial(n,[1/tiles**2]*tiles**2)
+        blocks=[]
+        for t in range(tiles**2):
+            rng=np.random.default_rng(streams[t+1])
+            count=counts[t]
+            kind=np.where(rng.random(count)<=pm,stick_kinds.index('m'),stick_kinds.index('s'))
+            xc=(t%tiles+rng.random(count))/tiles
+            yc=(t//tiles+rng.random(count))/tiles
+            angle=rng.random(count)*2*np.pi
+            if type(l)!=str:
+                length=np.full(count,l/scaling)
+            elif l=='exp':
+                length=abs(rng.normal(0.66,0.44,count))/scaling
+            else:
+                raise ValueError('invalid L value')
+            blocks.append(StickArrays(xc,yc,angle,length,kind))
+        source=StickArrays([0.01],[0.5],[np.pi/2-1e-6],[100],[stick_kinds.index('v')])
+        drain=StickArrays([.99],[0.5],[np.pi/2-1e-6],[100],[stick_kinds.index('v')])
+        return StickArrays.concatenate([source]+blocks+[drain])
+
+    def make_intersects_tiled(self,sticks,tiles,workers=1):
+        """make_intersects_kdtree split over a tiles x tiles grid. Each tile
+        finds, in a separate process, the intersections lying inside it among
+        the sticks whose bounding box overlaps it, and the tiles are merged in
+        a fixed order, so the result does not depend on workers."""
+        sticks.cluster=np.arange(len(sticks),dtype=np.int32)
+        # stable sort so that sticks of equal length keep a reproducible order
+        sticks=sticks.take(np.argsort(-sticks.length,kind='stable'))
+        X=sticks.centers
+        lengths=sticks.length
+        kinds=sticks.kind
+        ends=sticks.ends
+        lo=ends.min(axis=1)
+        hi=ends.max(axis=1)
+        tasks=[]
+        for t in range(tiles**2):
+            tx,ty=t%tiles,t//tiles
+            x0,x1,y0,y1=tx/tiles,(tx+1)/tiles,ty/tiles,(ty+1)/tiles
+            index=np.flatnonzero((hi[:,0]>=x0)&(lo[:,0]<=x1)&(hi[:,1]>=y0)&(lo[:,1]<=y1))
+            tasks.append(((x0,x1,y0,y1,tx==tiles-1,ty==tiles-1),index,X[index],lengths[index],ends[index],kinds[index]))
+        if workers>1:
+            pool=Pool(workers)
+            results=pool.map(_tile_intersects,tasks,chunksize=1)
+            pool.close()
+        else:
+            results=[_tile_intersects(task) for task in tasks]
+        pairs=np.concatenate([r[0] for r in results]).reshape(-1,2)
+        points=np.concatenate([r[1] for r in results]).reshape(-1,2)
+        kind=np.concatenate([r[2] for r in results])
+        order=np.lexsort((pairs[:,1],pairs[:,0]))
+        return sticks, IntersectArrays(pairs[order,0],pairs[order,1],points[order,0],points[order,1],kind[order])
 
     def make_trivial_sticks(self):
         source=[0.01, 0.5,np.pi/2-1e-6,1.002,'m']
-        source.append(self.get_ends(source))
         drain=[.99, 0.5,np.pi/2-1e-6,1.001,'m']
-        drain.append(self.get_ends(drain))
         st1=[0.3, 0.5,np.pi/4,1,'s']
-        st1.append(self.get_ends(st1))
         st2=[0.7, 0.5,-np.pi/4,1,'s']
-        st2.append(self.get_ends(st2))
         st3=[0.5, 0.5,-np.pi/4,0.1,'s']
-        st3.append(self.get_ends(st3))
         st4=[0.5, 0.5,np.pi/4,0.1,'s']
-        st4.append(self.get_ends(st4))
-        sticks=pd.DataFrame([source]+[st1]+[st2]+[st3]+[st4]+[drain],columns=[ "xc", "yc", "angle", "length",'kind', "endarray"])
+        rows=[source]+[st1]+[st2]+[st3]+[st4]+[drain]
+        geometry=np.array([row[:4] for row in rows],dtype=float)
+        sticks=StickArrays(*geometry.T,kind=[stick_kinds.index(row[4]) for row in rows])
         self.sticks, self.intersects  = self.make_intersects_kdtree(sticks)
         self.make_cnet()
 
 
 
-    def make_graph(self):
+    def stick_components(self):
+        """connected component label of every stick, from the junctions"""
+        import scipy.sparse as sparse
+        from scipy.sparse.csgraph import connected_components
+        n=len(self.sticks)
+        adjacency=sparse.coo_matrix((np.ones(len(self.intersects)),(self.intersects.stick1,self.intersects.stick2)),shape=(n,n))
+        return connected_components(adjacency,directed=False)[1]
+
+    def check_percolation(self,cluster=None):
+        """Sets spanning_cluster, the sticks connected to both the source and
+        drain, and percolating, without building a graph. cluster optionally
+        gives a known spanning cluster."""
+        if cluster is None:
+            labels=self.stick_components()
+            if labels[0]==labels[1]:
+                cluster=np.flatnonzero(labels==labels[0])
+            else:
+                cluster=np.zeros(0,dtype=int)
+        self.spanning_cluster=np.asarray(cluster)
+        self.percolating=bool(len(self.spanning_cluster))
+        return self.percolating
+
+    def make_graph(self,cluster=None):
+        """cluster optionally gives the sticks of the spanning cluster, as
+        stored in spanning_cluster, to skip finding it again"""
+        import networkx as nx
         # only calculates the conduction through the spanning cluster of sticks
         # to avoid the creation of a singular adjacency matrix caused by
         # disconnected junctions becoming unconnected nodes in the cnet
-        self.graph=nx.from_pandas_edgelist(self.intersects, source='stick1',target='stick2',edge_attr=True)
-        for c in nx.connected_components(self.graph):
-            if (0 in c) and (1 in c):
-                self.percolating=True
-                connected_graph=self.graph.subgraph(c)
+        isects=self.intersects
+        self.graph=nx.Graph()
+        self.graph.add_edges_from((int(s1),int(s2),{'x':float(x),'y':float(y),'kind':kind}) for s1,s2,x,y,kind in zip(isects.stick1,isects.stick2,isects.x,isects.y,isects.kind_names))
+        if self.check_percolation(cluster):
+            connected_graph=self.graph.subgraph(self.spanning_cluster.tolist())
         if self.percolating:
             self.ground_nodes=[1]
             self.voltage_sources=[[0,0.1]]
             self.populate_graph(self.onoffmap)
             for node in connected_graph.nodes():
-                connected_graph.nodes[node]['pos'] = [self.sticks.loc[node,'xc'], self.sticks.loc[node,'yc']]
+                connected_graph.nodes[node]['pos'] = [float(self.sticks.xc[node]), float(self.sticks.yc[node])]
             for edge in connected_graph.edges():
                 connected_graph.edges[edge]['pos'] = [connected_graph.edges[edge]['x'], connected_graph.edges[edge]['y']]
             return connected_graph
         else:
             return False,False,False
 
+    def set_element(self,element,onoffmap):
+        """Replaces the conduction element of every junction, keeping the
+        geometry, clusters and graph, and re-solves the network at zero gate."""
+        self.element=element
+        self.onoffmap=onoffmap
+        self.populate_graph(onoffmap)
+        if self.percolating:
+            self.cnet.base_lu=None
+            self.cnet.base_conductance=None
+            self.cnet.gate_areas=[]
+            self.cnet.set_global_gate(0)
+            self.cnet.update()
+
     def populate_graph(self,onoffmap):
 
         for edge in self.graph.edges():
             self.graph.edges[edge]['component']=self.element( self.graph.edges[edge]['kind'], onoffmap )
 
     def label_clusters(self):
-        i=0
-        components=nx.connected_components(self.graph)
-        clustersizes=[]
-        for c in components:
-            clustersizes.append(len(c))
-            for n in c:
-                self.sticks.loc[n,'cluster']=i
-            i+=1
-        self.clustersizes=np.array(clustersizes)
-    def make_cnet(self):
+        # numbers the clusters of sticks with junctions 0,1,2... sticks without
+        # any junction keep their original number
+        nodes=np.unique(np.append(self.intersects.stick1,self.intersects.stick2))
+        clusters=np.unique(self.stick_components()[nodes],return_inverse=True)[1].ravel()
+        self.sticks.cluster[nodes]=clusters
+        self.clustersizes=np.bincount(clusters)
+    def make_cnet(self,cluster=None):
         try:
-            connected_graph=self.make_graph()
+            connected_graph=self.make_graph(cluster)
             assert self.percolating, "The network is not conducting!"
-            self.cnet=ConductionNetwork(connected_graph,self.ground_nodes,self.voltage_sources)
+            self.cnet=ConductionNetwork(connected_graph,self.ground_nodes,self.voltage_sources,solver=self.solver,tol=self.tol,preconditioner=self.preconditioner)
             self.cnet.set_global_gate(0)
             # self.cnet.set_local_gate([0.5,0,0.16,0.667], 10)
             self.cnet.update()
         except:
-            connected_graph=self.make_graph()
+            connected_graph=self.make_graph(cluster)
             traceback.print_exc(file=sys.stdout)
             pass
 
@@ -225,25 +469,29 @@ class RandomConductingNetwork(object):
         fname=os.path.join(self.directory,self.notes)
         return fname
 
-    def save_system(self,fname=False):
-        #saves the sticks DataFrame
+    def save_system(self,fname=False,compress=False):
+        #saves the sticks DataFrame, gzipped as .csv.gz with compress
         if not(fname):
             fname=self.fname
-        self.sticks.to_csv(fname+'_sticks.csv')
+        ext='.csv.gz' if compress else '.csv'
+        # explicit, as pandas only infers it from the suffix from 0.24
+        compression='gzip' if compress else None
+        self.sticks.to_dataframe().to_csv(fname+'_sticks'+ext,compression=compression)
         #saves the intersects dataframe
-        self.intersects.to_csv(fname+'_intersects.csv')
+        self.intersects.to_dataframe().to_csv(fname+'_intersects'+ext,compression=compression)
         #save the graph object
         # nx.write_yaml(self.graph,self.fname+'_graph.yaml')
 
     def load_system(self,fname,network=True):
+        import pandas as pd
         # need to incorporate intelligent filename reading if we want
         # to be able to display files without manually imputting scaling
         # print("loading sticks")
-        self.sticks=pd.read_csv(fname+'_sticks.csv',index_col=0)
-        # print("recalculating endpoints")
-        self.sticks.endarray=[self.get_ends(row) for row in self.sticks.values]
+        # endpoints are recalculated from the geometry on first use
+        ext,compression=('.csv',None) if os.path.isfile(fname+'_sticks.csv') else ('.csv.gz','gzip')
+        self.sticks=StickArrays.from_dataframe(pd.read_csv(fname+'_sticks'+ext,index_col=0,compression=compression),dtype=self.dtype)
         # print("loading intersects")
-        self.intersects=pd.read_csv(fname+'_intersects.csv',index_col=0)
+        self.intersects=IntersectArrays.from_dataframe(pd.read_csv(fname+'_intersects'+ext,index_col=0,compression=compression),dtype=self.dtype)
         if network:
             # print("making cnet")
             self.make_cnet()
@@ -259,11 +507,50 @@ class RandomCNTNetwork(RandomConductingNetwork):
         self.cnet.set_global_gate(vg)
         self.cnet.update()
         return sum(self.cnet.source_currents)
-    def local_gate(self,vg,area):
+    def local_gate(self,vg,area,lowrank=False):
+        if lowrank:
+            return self.local_gate_lowrank(vg,area)
         self.cnet.set_local_gate(area, vg)
         self.cnet.update()
         return sum(self.cnet.source_currents)
-    def gate(self,vg,gate):
+    def local_gate_lowrank(self,vg,area,update=True):
+        """Local gate solved as a low rank update of the ungated (vg=0)
+        network, which is factored once on first use. Any global gate or
+        previous local gate is reset. With update=False only the device current
+        is computed and the graph voltages and currents are left untouched.
+        Only pays off for gates over at most cnet.lowrank_limit junctions, as
+        in scan_gate, and on networks small enough for a direct solver. Larger
+        areas, like the partial and total gates, and networks solved
+        iteratively are solved in full.
+        """
+        if self.cnet.base_conductance is None:
+            self.cnet.gate_areas=[]
+            self.cnet.set_global_gate(0)
+            self.cnet.factor_base()
+        if update and (self.cnet.base_lu is None or len(self.cnet.get_local_edge_indices(area))>lowrank_limit):
+            self.cnet.gate_areas=[]
+            self.cnet.set_global_gate(0)
+            return self.local_gate(vg,area)
+        mna_x=self.cnet.lowrank_local_gate(area,vg)
+        if update:
+            self.cnet.gate_areas=[]
+            self.cnet.set_global_gate(0)
+            self.cnet.set_local_gate(area, vg)
+            self.cnet.update_conductivity()
+            self.cnet.update_voltages(mna_x)
+            self.cnet.update_currents()
+        return sum(self.cnet.source_currents)
+    def scan_gate(self,vg,width,height,xs,ys):
+        """Scanning gate map: device current with a width x height local gate
+        centred at every (x,y) of the grid xs, ys. Returns an array of shape
+        (len(ys),len(xs)). Each position costs one low rank update.
+        """
+        currents=np.zeros((len(ys),len(xs)))
+        for i,y in enumerate(ys):
+            for j,x in enumerate(xs):
+                currents[i,j]=self.local_gate_lowrank(vg,[x,y,width,height],update=False)
+        return currents
+    def gate(self,vg,gate,lowrank=False):
         self.gatetype=gate
         self.gatevoltage=vg
         self.cnet.gate_areas=[]
@@ -271,9 +558,9 @@ class RandomCNTNetwork(RandomConductingNetwork):
         if gate =='back':
             self.global_gate(vg)
         elif gate == 'partial':
-            self.local_gate(vg,[0.5,0,0.16,0.667])
+            self.local_gate(vg,[0.5,0,0.16,0.667],lowrank=lowrank)
         elif gate == 'total':
-            self.local_gate(vg,[0.217,0.5,0.167,1.2])
+            self.local_gate(vg,[0.217,0.5,0.167,1.2],lowrank=lowrank)
         return sum(self.cnet.source_currents)
 
 if __name__ == "__main__":
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+    File name: netstats.py
+    Author: Leo Browning
+    email: leobrowning92@gmail.com
+    Date created: 19/10/2026 (DD/MM/YYYY)
+    Python Version: 3.5
+    Description:
+    Graph statistics of a solved conduction network computed from the arrays
+    of cnet.ConductionNetwork rather than with networkx. Path lengths are
+    estimated by breadth first search from a sample of nodes and clustering
+    from sparse matrix triangle counts over a sample of nodes, so the cost is
+    set by the number of samples. Used by measure_perc.single_measure(stats=...).
+"""
+import numpy as np
+import scipy.sparse as sparse
+from scipy.sparse.csgraph import shortest_path
+
+statcols=['charpath','clustercoeff','transitivity','sdhops','backbone','carrying']
+
+def adjacency(cnet):
+    """unweighted symmetric adjacency matrix in cnet.nodelist order"""
+    n1,n2=cnet.edge_index.T
+    A=sparse.coo_matrix((np.ones(2*len(n1)),(np.append(n1,n2),np.append(n2,n1))),shape=(cnet.network_size,cnet.network_size)).tocsr()
+    A.data[:]=1
+    return A
+
+def sample_nodes(n,samples,rng):
+    """all nodes if samples is 0 or at least n, otherwise a random sample"""
+    if not samples or samples>=n:
+        return np.arange(n)
+    return np.sort(rng.choice(n,samples,replace=False))
+
+def path_length(A,samples=100,rng=None):
+    """mean number of hops between connected pairs of nodes, by breadth first
+    search from samples source nodes (every node if 0)"""
+    if rng is None:
+        rng=np.random.default_rng()
+    sources=sample_nodes(A.shape[0],samples,rng)
+    total=0.
+    count=0
+    # a few sources at a time to bound the memory of the distance rows
+    for chunk in np.array_split(sources,max(1,len(sources)//64)):
+        d=shortest_path(A,unweighted=True,directed=False,indices=chunk)
+        d=d[np.isfinite(d)&(d>0)]
+        total+=d.sum()
+        count+=len(d)
+    return float(total/count) if count else 0.
+
+def clustering(A,samples=100,rng=None):
+    """
+    Returns:
+        the average clustering coefficient over samples nodes (every node if
+        0), with nodes of degree < 2 counting as 0 as in networkx, and the
+        transitivity (3 x triangles / connected triples) of those nodes
+    """
+    if rng is None:
+        rng=np.random.default_rng()
+    nodes=sample_nodes(A.shape[0],samples,rng)
+    rows=A[nodes]
+    # twice the triangles through each node, the (A^3)_ii of its rows only
+    triangles=np.asarray(rows.dot(A).multiply(rows).sum(axis=1)).ravel()/2
+    degree=np.asarray(rows.sum(axis=1)).ravel()
+    triples=degree*(degree-1)/2
+    with np.errstate(divide='ignore',invalid='ignore'):
+        local=np.where(triples>0,triangles/triples,0.)
+    transitivity=triangles.sum()/triples.sum() if triples.sum() else 0.
+    return float(local.mean()) if len(local) else 0.,float(transitivity)
+
+def source_drain_hops(A,source,drain):
+    """fewest junctions between the source and drain electrodes"""
+    d=shortest_path(A,unweighted=True,directed=False,indices=[source])[0,drain]
+    return float(d) if np.isfinite(d) else np.nan
+
+def backbone(cnet,current_tol=1e-9):
+    """
+    Args:
+      current_tol: edges carrying less than this fraction of the source
+        current are dangling, as their current is only numerical noise
+
+    Returns:
+        number of nodes on current carrying edges, and the fraction of edges
+        that carry current
+    """
+    total=float(np.abs(np.sum(cnet.source_currents)))
+    carrying=cnet.currents>current_tol*total
+    nodes=np.unique(cnet.edge_index[carrying])
+    return len(nodes),float(carrying.mean()) if len(carrying) else 0.
+
+def network_stats(cnet,samples=100,seed=None,current_tol=1e-9):
+    """
+    Args:
+      cnet: solved cnet.ConductionNetwork
+      samples: nodes sampled for path lengths and clustering, 0 for all of
+        them (exact, but quadratic in the network size)
+      seed: seed of the node sample
+
+    Returns:
+        dict of statcols
+    """
+    rng=np.random.default_rng(seed)
+    A=adjacency(cnet)
+    clustercoeff,transitivity=clustering(A,samples,rng)
+    size,carrying=backbone(cnet,current_tol)
+    return {'charpath':path_length(A,samples,rng),
+            'clustercoeff':clustercoeff,
+            'transitivity':transitivity,
+            'sdhops':source_drain_hops(A,int(cnet.voltage_sources[0,0]),int(cnet.ground_nodes[0])),
+            'backbone':size,
+            'carrying':carrying}
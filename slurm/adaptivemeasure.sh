@@ -0,0 +1,12 @@
+#!/bin/bash
+# same densities as batchmeasure_multi.sh, but with replicates scheduled by
+# measure_perc.py adaptive until the statistics at each density reach their
+# target precision, rather than a fixed 100 per density
+mkdir data_8-12_adaptive
+cd data_8-12_adaptive
+omap=0
+cores=16
+densities=$(for step in {0..16}; do echo 8+0.25*$step | bc; done)
+echo 'python3 ~/gitrepos/networksim-cntfet/measure_perc.py adaptive -v --scaling 60 --onoffmap '$omap' --element 1 --cores '$cores' --densities '$densities' --maxreps 400' > madaptive.sh
+subpy -P $cores -t 7-0 madaptive.sh
+cd ..
@@ -0,0 +1,35 @@
+#!/bin/bash
+# same measurements as batchmeasure_multi.sh, but written to manifests of
+# $chunk rows that each run in a single warm process (measure_perc.py batch)
+mkdir data_8-12_1700x
+cd data_8-12_1700x
+omap=0
+element=1
+chunk=50
+manifest=0
+rows=0
+for step in {0..16}
+do
+    density=$(echo 8+0.25*$step | bc)
+    n=$(echo $density*3600 | bc)
+    n=${n%.*}
+    for x in {1..100}
+    do
+        if [ $rows -eq 0 ]; then
+            echo 'n,scaling,seed,onoffmap,element' > manifest$manifest.csv
+        fi
+        echo $n',60,'$(shuf -i 1-4294967295 -n 1)','$omap','$element >> manifest$manifest.csv
+        rows=$((rows+1))
+        if [ $rows -eq $chunk ]; then
+            echo 'python3 ~/gitrepos/networksim-cntfet/measure_perc.py batch -v --pipeline --manifest manifest'$manifest'.csv' > mbatch$manifest.sh
+            subpy -P 1 -t 2-0 mbatch$manifest.sh
+            manifest=$((manifest+1))
+            rows=0
+        fi
+    done
+done
+if [ $rows -ne 0 ]; then
+    echo 'python3 ~/gitrepos/networksim-cntfet/measure_perc.py batch -v --pipeline --manifest manifest'$manifest'.csv' > mbatch$manifest.sh
+    subpy -P 1 -t 2-0 mbatch$manifest.sh
+fi
+cd ..
@@ -13,42 +13,42 @@ density=9.5
 seed=3712050199
 n=$(echo $density*3600 | bc)
 n=${n%.*}
-echo 'python3 ~/gitrepos/networksim-cntfet/measure_perc.py singlecore -s -v  -n '$n' --scaling 60 --onoffmap '$omap' --element 1 --seed '$seed' --vgnum=11' > mns$seed'om'$omap'd'$density.sh
+echo 'python3 ~/gitrepos/networksim-cntfet/measure_perc.py singlecore -s -v  -n '$n' --scaling 60 --onoffmap '$omap' --element 1 --seed '$seed' --vgnum=11 --checkpoint' > mns$seed'om'$omap'd'$density.sh
 subpy -P 1 -t 2-0 mns$seed'om'$omap'd'$density.sh
 
 density=9.75
 seed=393068919
 n=$(echo $density*3600 | bc)
 n=${n%.*}
-echo 'python3 ~/gitrepos/networksim-cntfet/measure_perc.py singlecore -s -v  -n '$n' --scaling 60 --onoffmap '$omap' --element 1 --seed '$seed' --vgnum=11' > mns$seed'om'$omap'd'$density.sh
+echo 'python3 ~/gitrepos/networksim-cntfet/measure_perc.py singlecore -s -v  -n '$n' --scaling 60 --onoffmap '$omap' --element 1 --seed '$seed' --vgnum=11 --checkpoint' > mns$seed'om'$omap'd'$density.sh
 subpy -P 1 -t 2-0 mns$seed'om'$omap'd'$density.sh
 
 density=10.25
 seed=245645779
 n=$(echo $density*3600 | bc)
 n=${n%.*}
-echo 'python3 ~/gitrepos/networksim-cntfet/measure_perc.py singlecore -s -v  -n '$n' --scaling 60 --onoffmap '$omap' --element 1 --seed '$seed' --vgnum=11' > mns$seed'om'$omap'd'$density.sh
+echo 'python3 ~/gitrepos/networksim-cntfet/measure_perc.py singlecore -s -v  -n '$n' --scaling 60 --onoffmap '$omap' --element 1 --seed '$seed' --vgnum=11 --checkpoint' > mns$seed'om'$omap'd'$density.sh
 subpy -P 1 -t 2-0 mns$seed'om'$omap'd'$density.sh
 
 density=10
 seed=2120982883
 n=$(echo $density*3600 | bc)
 n=${n%.*}
-echo 'python3 ~/gitrepos/networksim-cntfet/measure_perc.py singlecore -s -v  -n '$n' --scaling 60 --onoffmap '$omap' --element 1 --seed '$seed' --vgnum=11' > mns$seed'om'$omap'd'$density.sh
+echo 'python3 ~/gitrepos/networksim-cntfet/measure_perc.py singlecore -s -v  -n '$n' --scaling 60 --onoffmap '$omap' --element 1 --seed '$seed' --vgnum=11 --checkpoint' > mns$seed'om'$omap'd'$density.sh
 subpy -P 1 -t 2-0 mns$seed'om'$omap'd'$density.sh
 
 density=12
 seed=2548038466
 n=$(echo $density*3600 | bc)
 n=${n%.*}
-echo 'python3 ~/gitrepos/networksim-cntfet/measure_perc.py singlecore -s -v  -n '$n' --scaling 60 --onoffmap '$omap' --element 1 --seed '$seed' --vgnum=11' > mns$seed'om'$omap'd'$density.sh
+echo 'python3 ~/gitrepos/networksim-cntfet/measure_perc.py singlecore -s -v  -n '$n' --scaling 60 --onoffmap '$omap' --element 1 --seed '$seed' --vgnum=11 --checkpoint' > mns$seed'om'$omap'd'$density.sh
 subpy -P 1 -t 2-0 mns$seed'om'$omap'd'$density.sh
 
 density=12
 seed=4191611272
 n=$(echo $density*3600 | bc)
 n=${n%.*}
-echo 'python3 ~/gitrepos/networksim-cntfet/measure_perc.py singlecore -s -v  -n '$n' --scaling 60 --onoffmap '$omap' --element 1 --seed '$seed' --vgnum=11' > mns$seed'om'$omap'd'$density.sh
+echo 'python3 ~/gitrepos/networksim-cntfet/measure_perc.py singlecore -s -v  -n '$n' --scaling 60 --onoffmap '$omap' --element 1 --seed '$seed' --vgnum=11 --checkpoint' > mns$seed'om'$omap'd'$density.sh
 subpy -P 1 -t 2-0 mns$seed'om'$omap'd'$density.sh
 
 
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+    File name: streamnet.py
+    Author: Leo Browning
+    email: leobrowning92@gmail.com
+    Date created: 19/10/2026 (DD/MM/YYYY)
+    Python Version: 3.5
+    Description:
+    Out of core construction of stick networks too large to hold in memory as
+    in netsim.py. The domain is generated in vertical strips, junctions are
+    found only against the sticks of earlier strips that can still reach the
+    current one, and sticks and junctions are spilled to memory mapped files.
+    Percolation and cluster sizes are tracked with a running union-find, so
+    memory use is set by the strip width rather than the device size.
+"""
+import argparse, os, tempfile
+import numpy as np
+from timeit import default_timer as timer
+from netsim import segment_intersections
+from netarrays import stick_ends, stick_kinds
+
+# spilled records, with kinds coded as in netarrays
+stick_dtype=np.dtype([('xc','f8'),('yc','f8'),('angle','f8'),('length','f8'),('kind','i1')])
+intersect_dtype=np.dtype([('stick1','i8'),('stick2','i8'),('x','f8'),('y','f8'),('kind','i1')])
+
+class StreamingNetwork(object):
+    """
+    Args:
+      n: number of sticks
+      scaling: size of the square device in um
+      l: stick length in um, or 'exp' as in netsim
+      pm: fraction of metallic sticks
+      seed: random seed, each strip draws from its own SeedSequence stream
+      strip_width: width of the generation strips in um, which sets the memory
+        used. Should be a few stick lengths wide.
+      directory: where to spill sticks.dat and intersects.dat, a temporary
+        directory if not given
+
+    Stick ids are 0 for the source electrode, 1..n for the sticks in order of
+    generation and n+1 for the drain electrode.
+    """
+    def __init__(self, n, scaling=5, l='exp', pm=0.135, seed=0, strip_width=2, directory=None):
+        self.n=n
+        self.scaling=scaling
+        self.l=l
+        self.pm=pm
+        if seed:
+            self.seed=seed
+        else:
+            self.seed=np.random.randint(low=0,high=2**32)
+        self.nstrips=max(1,int(np.ceil(scaling/strip_width)))
+        if directory is None:
+            directory=tempfile.mkdtemp(prefix='streamnet')
+        os.makedirs(directory,exist_ok=True)
+        self.directory=directory
+        self.parent=np.arange(n+2,dtype=np.int64)
+        self.max_pool=0
+        self.nintersects=0
+
+    def find(self,nodes):
+        """vectorized union-find root lookup with path compression"""
+        roots=np.array(nodes,dtype=np.int64)
+        while True:
+            parents=self.parent[roots]
+            if (parents==roots).all():
+                break
+            roots=parents
+        self.parent[nodes]=roots
+        return roots
+
+    def union(self,pairs):
+        """merges the clusters joined by an (m,2) array of stick ids"""
+        import scipy.sparse as sparse
+        from scipy.sparse.csgraph import connected_components
+        if not len(pairs):
+            return
+        roots,inverse=np.unique(self.find(pairs.ravel()),return_inverse=True)
+        inverse=inverse.reshape(-1,2)
+        graph=sparse.coo_matrix((np.ones(len(inverse)),(inverse[:,0],inverse[:,1])),shape=(len(roots),len(roots)))
+        ncomp,labels=connected_components(graph,directed=False)
+        # the smallest root of each merged cluster becomes its new root
+        rep=np.full(ncomp,np.iinfo(np.int64).max)
+        np.minimum.at(rep,labels,roots)
+        self.parent[roots]=rep[labels]
+
+    def make_strip(self,rng,count,strip,first_id):
+        width=1/self.nstrips
+        kind=(rng.random(count)<=self.pm).astype(np.int8)
+        xc=(strip+rng.random(count))*width
+        yc=rng.random(count)
+        angle=rng.random(count)*2*np.pi
+        if type(self.l)!=str:
+            length=np.full(count,self.l/self.scaling)
+        elif self.l=='exp':
+            length=abs(rng.normal(0.66,0.44,count))/self.scaling
+        else:
+            raise ValueError('invalid L value')
+        sticks=np.zeros(count,dtype=stick_dtype)
+        sticks['xc'],sticks['yc'],sticks['angle'],sticks['length'],sticks['kind']=xc,yc,angle,length,kind
+        return np.arange(first_id,first_id+count),sticks
+
+    def electrode(self,xc):
+        stick=np.zeros(1,dtype=stick_dtype)
+        stick['xc'],stick['yc'],stick['angle'],stick['length'],stick['kind']=xc,0.5,np.pi/2-1e-6,100,stick_kinds.index('v')
+        return stick
+
+    def strip_intersects(self,ids,sticks,ends,current):
+        """junctions among the pool of sticks that involve at least one stick
+        of the current strip (current is a mask over the pool)"""
+        import scipy.spatial as spatial
+        X=np.stack([sticks['xc'],sticks['yc']],axis=1)
+        neighbors=spatial.cKDTree(X).query_ball_point(X,sticks['length'])
+        counts=np.array([len(nb) for nb in neighbors])
+        i=np.repeat(np.arange(len(ids)),counts)
+        j=np.concatenate(neighbors).astype(int)
+        # two crossing sticks are always within the longer one's length, so
+        # every pair is found from at least one side
+        i,j=np.minimum(i,j),np.maximum(i,j)
+        keep=(i!=j)&(current[i]|current[j])
+        pairs=np.unique(np.stack([i[keep],j[keep]],axis=1),axis=0).reshape(-1,2)
+        i,j=pairs[:,0],pairs[:,1]
+        xi,yi,mask=segment_intersections(ends[i],ends[j])
+        mask&=(0<=xi)&(xi<=1)&(0<=yi)&(yi<=1)
+        i,j=i[mask],j[mask]
+        order=ids[i]>ids[j]
+        i[order],j[order]=j[order],i[order]
+        intersects=np.zeros(len(i),dtype=intersect_dtype)
+        intersects['stick1'],intersects['stick2']=ids[i],ids[j]
+        intersects['x'],intersects['y']=xi[mask],yi[mask]
+        intersects['kind']=3*sticks['kind'][i]+sticks['kind'][j]
+        return intersects
+
+    def build(self,v=False):
+        """generates the network strip by strip, spilling to disk as it goes"""
+        start=timer()
+        streams=np.random.SeedSequence(self.seed).spawn(self.nstrips+1)
+        counts=np.random.default_rng(streams[0]).multinomial(self.n,[1/self.nstrips]*self.nstrips)
+        # a first pass over the strip streams for the longest stick, which
+        # bounds how far left of its strip any later stick can reach
+        self.max_length=max([self.make_strip(np.random.default_rng(streams[strip+1]),counts[strip],strip,0)[1]['length'].max(initial=0) for strip in range(self.nstrips)])
+        # pool of sticks from earlier strips, with their ids and ends
+        pool_ids=np.array([0])
+        pool=self.electrode(0.01)
+        first_id=1
+        with open(self.sticks_path,'wb') as fsticks, open(self.intersects_path,'wb') as fisects:
+            pool.tofile(fsticks)
+            for strip in range(self.nstrips):
+                ids,sticks=self.make_strip(np.random.default_rng(streams[strip+1]),counts[strip],strip,first_id)
+                first_id+=counts[strip]
+                sticks.tofile(fsticks)
+                if strip==self.nstrips-1:
+                    ids=np.append(ids,self.n+1)
+                    sticks=np.append(sticks,self.electrode(.99))
+                ends=stick_ends(sticks['xc'],sticks['yc'],sticks['angle'],sticks['length'])
+                pool_ends=stick_ends(pool['xc'],pool['yc'],pool['angle'],pool['length'])
+                # sticks are dropped from the pool for good, so keep any that
+                # this or a later strip could still cross. Those sticks are
+                # centred right of strip_left and reach at most max_length/2
+                # left of it, the drain being the only one outside its strip
+                left=strip/self.nstrips-self.max_length/2
+                if len(ends):
+                    left=min(left,ends[:,:,0].min())
+                reach=pool_ends[:,:,0].max(axis=1)>=left
+                pool_ids,pool,pool_ends=pool_ids[reach],pool[reach],pool_ends[reach]
+                all_ids=np.append(pool_ids,ids)
+                all_sticks=np.append(pool,sticks)
+                all_ends=np.concatenate([pool_ends,ends])
+                current=np.arange(len(all_ids))>=len(pool_ids)
+                self.max_pool=max(self.max_pool,len(all_ids))
+                intersects=self.strip_intersects(all_ids,all_sticks,all_ends,current)
+                intersects.tofile(fisects)
+                self.nintersects+=len(intersects)
+                self.union(np.stack([intersects['stick1'],intersects['stick2']],axis=1))
+                pool_ids,pool=all_ids,all_sticks
+                if v:
+                    print("strip {}/{}: pool {} sticks, {} junctions t = {:0.2f}".format(strip+1,self.nstrips,len(all_ids),self.nintersects,timer()-start))
+            self.electrode(.99).tofile(fsticks)
+        self.collect_clusters()
+        self.runtime=timer()-start
+        return self
+
+    def collect_clusters(self):
+        roots=self.find(np.arange(self.n+2))
+        self.percolating=bool(roots[0]==roots[self.n+1])
+        # cluster sizes count sticks only, isolated sticks being size 1
+        self.clustersizes=np.bincount(roots[1:self.n+1])
+        self.clustersizes=self.clustersizes[self.clustersizes>0]
+        self.spanning_size=int((roots[1:self.n+1]==roots[0]).sum()) if self.percolating else 0
+
+    @property
+    def sticks_path(self):
+        return os.path.join(self.directory,'sticks.dat')
+    @property
+    def intersects_path(self):
+        return os.path.join(self.directory,'intersects.dat')
+    @property
+    def sticks(self):
+        """memory mapped sticks in file order: source, sticks 1..n, drain"""
+        return np.memmap(self.sticks_path,dtype=stick_dtype,mode='r')
+    @property
+    def intersects(self):
+        if not self.nintersects:
+            return np.zeros(0,dtype=intersect_dtype)
+        return np.memmap(self.intersects_path,dtype=intersect_dtype,mode='r')
+
+    def get_info(self):
+        print('number of sticks: {}'.format(self.n))
+        print('device region: {}x{} μm in {} strips'.format(self.scaling,self.scaling,self.nstrips))
+        print('stick density: {} sticks/μm^2'.format(self.n/self.scaling**2))
+        print('number of junctions: {}'.format(self.nintersects))
+        print('number of clusters: {}'.format(len(self.clustersizes)))
+        print('maximum cluster size: {} sticks'.format(self.clustersizes.max() if len(self.clustersizes) else 0))
+        print('device percolating: {}'.format(self.percolating))
+        print('spanning cluster size: {} sticks'.format(self.spanning_size))
+        print('largest stick pool held in memory: {} sticks'.format(self.max_pool))
+        print('runtime: {:.1f} s'.format(self.runtime))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n',"--number",type=int)
+    parser.add_argument("--pm",type=float,default=0.135)
+    parser.add_argument("--length",default='exp')
+    parser.add_argument("--scaling",type=float,default=5)
+    parser.add_argument("--seed",type=int,default=0)
+    parser.add_argument("--strip",type=float,default=2, help="width of generation strips in um")
+    parser.add_argument('-d','--directory',type=str,default=None, help="where to spill sticks and junctions")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+    net=StreamingNetwork(args.number, scaling=args.scaling, l=args.length, pm=args.pm, seed=args.seed, strip_width=args.strip, directory=args.directory)
+    net.build(v=args.verbose)
+    net.get_info()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+    File name: test_streamnet.py
+    Author: Leo Browning
+    email: leobrowning92@gmail.com
+    Date created: 19/10/2026 (DD/MM/YYYY)
+    Python Version: 3.5
+    Description:
+    Checks the junctions of streamnet.StreamingNetwork against a brute force
+    search over every pair of sticks. Run with pytest.
+"""
+import numpy as np
+import pytest
+from netsim import segment_intersections
+from netarrays import stick_ends
+from streamnet import StreamingNetwork
+
+def brute_force_pairs(sticks):
+    """(stick1, stick2) of every pair of crossing sticks inside the device"""
+    ends=stick_ends(sticks['xc'],sticks['yc'],sticks['angle'],sticks['length'])
+    # the drain is stored last but numbered n+1 like the other ids
+    ids=np.arange(len(sticks))
+    i,j=np.triu_indices(len(sticks),k=1)
+    xi,yi,mask=segment_intersections(ends[i],ends[j])
+    mask&=(0<=xi)&(xi<=1)&(0<=yi)&(yi<=1)
+    return set(zip(ids[i[mask]].tolist(),ids[j[mask]].tolist()))
+
+@pytest.mark.parametrize('n,scaling,seed,strip_width',[
+    (1500,5,7,0.1),
+    (1500,5,3,0.25),
+    (800,10,1,1),
+    (300,2,5,2)])
+def test_junctions_match_brute_force(tmpdir,n,scaling,seed,strip_width):
+    net=StreamingNetwork(n,scaling=scaling,seed=seed,strip_width=strip_width,directory=str(tmpdir)).build()
+    sticks=np.array(net.sticks)
+    # strips narrower than the longest stick are where reach is easy to get wrong
+    assert strip_width/scaling<sticks['length'][1:-1].max() or net.nstrips==1
+    found=net.intersects
+    pairs=set(zip(found['stick1'].tolist(),found['stick2'].tolist()))
+    assert len(pairs)==len(found)
+    assert pairs==brute_force_pairs(sticks)
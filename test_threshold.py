@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+    File name: test_threshold.py
+    Author: Leo Browning
+    email: leobrowning92@gmail.com
+    Date created: 19/10/2026 (DD/MM/YYYY)
+    Python Version: 3.5
+    Description:
+    Checks that the confidence intervals of measure_perc.find_threshold cover
+    a known threshold, with the percolation checks replaced by draws from a
+    logistic curve as broad as that of a 3 um device. Run with pytest.
+"""
+import numpy as np
+import pytest
+from scipy.special import expit
+import measure_perc
+
+scaling=3
+threshold=9.6
+slope=0.63
+
+def logistic_probe(args):
+    n,scaling,seed,tiles,periodic=args
+    return bool(np.random.RandomState(seed).random_sample()<expit(slope*(n/scaling**2-threshold)))
+
+@pytest.fixture
+def logistic(monkeypatch):
+    monkeypatch.setattr(measure_perc,'percolation_probe',logistic_probe)
+
+def test_interval_coverage(logistic):
+    runs=40
+    covered=0
+    for run in range(runs):
+        seeds=np.random.RandomState(run).randint(1,2**31,size=20000)
+        result=measure_perc.find_threshold(scaling,2,12,precision=0.3,seeds=seeds)
+        assert result['converged']
+        assert result['ci_low']<result['threshold']<result['ci_high']
+        covered+=result['ci_low']<=threshold<=result['ci_high']
+    # 95% intervals cover around 93% of the time when sampling stops at the
+    # first narrow one, so below 34 of 40 happens by chance about 2% of the
+    # time
+    assert covered>=34
+
+def test_interval_wide_on_one_density():
+    # samples that nearly all share one density say next to nothing about the
+    # slope, and so little about the threshold, which the delta method
+    # interval does not show
+    density=[8]*5+[9]*90+[10]*5
+    percolating=[0,0,0,0,1]+[0,1]*45+[0,1,1,1,1]
+    fit=measure_perc.fit_logistic(density,percolating)
+    low,high=measure_perc.profile_interval(density,percolating,fit,1.96,2,12)
+    assert high-low>2*1.96*fit[1]
@@ -18,18 +18,28 @@ from matplotlib.collections import LineCollection
 import matplotlib.patches as patches
 import matplotlib.tri as tri
 from mpl_toolkits.axes_grid1.inset_locator import inset_axes
+import matplotlib.animation as animation
 import networkx as nx
+from multiprocessing import Pool
+from contextlib import ExitStack
 from netsim import RandomConductingNetwork ,RandomCNTNetwork
+from netarrays import stick_kinds, junction_codes
+from fielddata import FieldDataset
 
 def open_data(path):
     df=pd.read_csv(path)
-    for device in df.seed.drop_duplicates():
-        if len(df[df.seed==device])==1:
+    # data from before periodic boundaries were added is not periodic, and
+    # devices are told apart by seed and periodic
+    if 'periodic' not in df:
+        df['periodic']=False
+    for device,periodic in df[['seed','periodic']].drop_duplicates().values:
+        devicemask=(df.seed==device)&(df.periodic==periodic)
+        if devicemask.sum()==1:
             pass
         else:
             for gatetype in ['back','partial','total']:
                 try:
-                    singlechipmask=(df.seed==device)&(df.gate==gatetype)
+                    singlechipmask=devicemask&(df.gate==gatetype)
                     on=df.loc[singlechipmask&(df.gatevoltage==-10),'current'].values[0]
                     off=df.loc[singlechipmask&(df.gatevoltage==10),'current'].values[0]
                     df.loc[singlechipmask,'onoff']=on/off
@@ -37,30 +47,117 @@ def open_data(path):
                     print ("ERROR calculating onoff for device seed : {}".format(device))
     df['relative_maxclust']=df.maxclust/df.sticks
     df['logonoff']=np.log10(df.onoff)
-    df = df[['seed', 'sticks', 'scaling', 'density', 'current', 'gatevoltage', 'gate', 'onoff','logonoff', 'nclust', 'maxclust', 'relative_maxclust', 'fname', 'onoffmap', 'runtime', 'element']]
+    df = df[['seed', 'sticks', 'scaling', 'density', 'current', 'gatevoltage', 'gate', 'onoff','logonoff', 'nclust', 'maxclust', 'relative_maxclust', 'fname', 'onoffmap', 'runtime', 'element', 'periodic']]
 
     return df
 
+def clip_segments(ends,extent=(0,1,0,1)):
+    """Clips segments given as an (n,2,2) array of [[x1,y1],[x2,y2]] to the
+    rectangle extent=(xmin,xmax,ymin,ymax). Returns the clipped ends and a
+    mask of the segments that have any part inside (Liang-Barsky)."""
+    p0=ends[:,0,:]
+    d=ends[:,1,:]-p0
+    t0=np.zeros(len(ends))
+    t1=np.ones(len(ends))
+    with np.errstate(divide='ignore',invalid='ignore'):
+        for axis,(lo,hi) in enumerate([extent[:2],extent[2:]]):
+            ta=(lo-p0[:,axis])/d[:,axis]
+            tb=(hi-p0[:,axis])/d[:,axis]
+            parallel=d[:,axis]==0
+            outside=parallel&((p0[:,axis]<lo)|(p0[:,axis]>hi))
+            t0=np.where(parallel,t0,np.maximum(t0,np.minimum(ta,tb)))
+            t1=np.where(parallel,t1,np.minimum(t1,np.maximum(ta,tb)))
+            t1=np.where(outside,-1,t1)
+    inside=t0<=t1
+    clipped=np.stack([p0+t0[:,None]*d,p0+t1[:,None]*d],axis=1)
+    return clipped[inside],inside
+
+def rasterize_points(x,y,weights=None,resolution=1000,extent=(0,1,0,1)):
+    """Sums point weights into a (resolution,resolution) image, row 0 at
+    ymin. weights may be (n,) or (n,c) for c channels, giving (res,res,c)."""
+    ix=np.floor((np.asarray(x)-extent[0])/(extent[1]-extent[0])*resolution).astype(np.int64)
+    iy=np.floor((np.asarray(y)-extent[2])/(extent[3]-extent[2])*resolution).astype(np.int64)
+    # points on the far edge belong to the last pixel
+    ix[ix==resolution]=resolution-1
+    iy[iy==resolution]=resolution-1
+    mask=(ix>=0)&(ix<resolution)&(iy>=0)&(iy<resolution)
+    pixel=iy[mask]*resolution+ix[mask]
+    if weights is None:
+        weights=np.ones(len(mask))
+    weights=np.asarray(weights,dtype=float)[mask]
+    if weights.ndim==1:
+        return np.bincount(pixel,weights,minlength=resolution**2).reshape(resolution,resolution)
+    return np.stack([np.bincount(pixel,w,minlength=resolution**2) for w in weights.T],axis=-1).reshape(resolution,resolution,-1)
+
+def rasterize_segments(ends,weights=None,resolution=1000,extent=(0,1,0,1),chunk=200000):
+    """Accumulates line segments, an (n,2,2) array of ends, into a
+    (resolution,resolution) image. Each segment is clipped to extent and
+    sampled at about one point per pixel along its length, each sample carrying
+    the segment weight times the pixel length it covers. Segments are processed
+    in chunks so memory stays bounded by chunk and the pixel count."""
+    ends=np.asarray(ends,dtype=float).reshape(-1,2,2)
+    if weights is None:
+        weights=np.ones(len(ends))
+    weights=np.asarray(weights,dtype=float)
+    image=0
+    pixelsize=np.array([extent[1]-extent[0],extent[3]-extent[2]])/resolution
+    for start in range(0,len(ends),chunk):
+        segs,inside=clip_segments(ends[start:start+chunk],extent)
+        w=weights[start:start+chunk][inside]
+        delta=segs[:,1,:]-segs[:,0,:]
+        length=np.hypot(*(delta/pixelsize).T)
+        nsamples=np.ceil(length).astype(np.int64)+1
+        seg=np.repeat(np.arange(len(segs)),nsamples)
+        offsets=np.arange(nsamples.sum())-np.repeat(np.cumsum(nsamples)-nsamples,nsamples)
+        t=(offsets+0.5)/nsamples[seg]
+        points=segs[seg,0,:]+t[:,None]*delta[seg]
+        scale=(np.maximum(length,1)/nsamples)[seg]
+        sw=w[seg]*(scale if w.ndim==1 else scale[:,None])
+        image=image+rasterize_points(points[:,0],points[:,1],sw,resolution,extent)
+    if np.isscalar(image):
+        shape=(resolution,resolution) if weights.ndim==1 else (resolution,resolution,weights.shape[1])
+        image=np.zeros(shape)
+    return image
+
+def coverage_to_rgb(coverage,colors):
+    """Multiplicatively blends per channel coverage (res,res,k) of k colors
+    onto white, a pixel crossed once by a stick is about 63% opaque."""
+    rgb=np.ones(coverage.shape[:2]+(3,))
+    alpha=1-np.exp(-coverage)
+    for k,color in enumerate(colors):
+        rgb*=1-alpha[:,:,k,None]*(1-np.asarray(matplotlib.colors.to_rgb(color)))
+    return rgb
+
 class CNTNetviewer(RandomCNTNetwork):
     def __init__(self,**kwargs):
         super(CNTNetviewer, self).__init__(**kwargs)
         self.label_clusters()
     # from percolation
-    def show_system(self,clustering=True, junctions=True, conduction=True, show=True, save=False,figsize=(6.3,4)):
+    def show_system(self,clustering=True, junctions=True, conduction=True, show=True, save=False,figsize=(6.3,4),raster=False,resolution=1000):
+        """with raster=True the sticks, voltages and currents are drawn as
+        resolution x resolution images, see show_sticks_raster"""
         fig, axes = plt.subplots(nrows=2,ncols=3,figsize=figsize, sharex=True, sharey=True, gridspec_kw={'wspace':0.1, 'hspace':0.05})
         axes=axes.flat
         self.label_clusters()
+        if raster:
+            show_sticks=lambda **kwargs: self.show_sticks_raster(resolution=resolution,**kwargs)
+            plot_voltages=lambda ax: self.plot_voltages_raster(ax,resolution=resolution)
+            plot_currents=lambda ax: self.plot_currents_raster(ax,resolution=resolution)
+        else:
+            show_sticks=self.show_sticks
+            plot_voltages=self.plot_voltages
+            plot_currents=self.plot_currents
         if clustering:
-            self.show_sticks(ax=axes[0],junctions=False, clusters=True)
+            show_sticks(ax=axes[0],junctions=False, clusters=True)
             axes[0].set_title("Sticks")
         if junctions:
-            self.show_sticks(ax=axes[3],junctions=True, clusters=False)
+            show_sticks(ax=axes[3],junctions=True, clusters=False)
             # axes[3].set_title("ms labeling and junctions")
         try:
             if conduction and self.percolating:
-                self.plot_voltages(axes[1])
+                plot_voltages(axes[1])
                 self.plot_regions(axes[1])
-                self.plot_currents(axes[2])
+                plot_currents(axes[2])
                 self.plot_regions(axes[2])
                 axes[1].set_title("Voltage")
                 axes[2].set_title("Current")
@@ -97,15 +194,15 @@ class CNTNetviewer(RandomCNTNetwork):
             ax=fig.add_subplot(111)
         if clusters:
             colors=np.append([[0,0,0]], np.random.rand(len(sticks),3), axis=0)
-            stick_colors=[colors[i] for i in sticks.cluster.values]
+            stick_colors=colors[sticks.cluster]
         else:
             stick_cmap={'s':'b','m':'r','v':'k'}
-            stick_colors=[stick_cmap[i] for i in sticks.kind]
-        collection=LineCollection(sticks.endarray.values,linewidth=0.5,colors=stick_colors)
+            stick_colors=[stick_cmap[i] for i in sticks.kind_names]
+        collection=LineCollection(sticks.ends,linewidth=0.5,colors=stick_colors)
         ax.add_collection(collection)
         if junctions:
             isect_cmap={'ms':'g','sm':'g', 'mm':'None','ss':'None','vs':'None','sv':' ','vm':'None','mv':'None'}
-            isect_colors=[isect_cmap[i] for i in self.intersects.kind]
+            isect_colors=[isect_cmap[i] for i in self.intersects.kind_names]
             ax.scatter(intersects.x, intersects.y, edgecolors=isect_colors, facecolors='None', s=20, linewidth=1, marker="o",alpha=0.8)
         ax.set_xlim((-0.02,1.02))
         ax.set_ylim((-0.02,1.02))
@@ -113,6 +210,64 @@ class CNTNetviewer(RandomCNTNetwork):
             plt.show()
         pass
 
+    def show_sticks_raster(self,ax=False, clusters=False, junctions=True, resolution=1000):
+        """raster version of show_sticks, cost scales with the pixel count
+        rather than with the number of sticks and junctions"""
+        sticks=self.sticks
+        if not(ax):
+            fig = plt.figure(figsize=(5,5),facecolor='white')
+            ax=fig.add_subplot(111)
+        ends=sticks.ends
+        if clusters:
+            colors=np.append([[0,0,0]], np.random.rand(len(sticks),3), axis=0)
+            stick_colors=colors[sticks.cluster]
+            # average cluster color weighted by coverage, then blended on white
+            weights=np.append(stick_colors,np.ones((len(sticks),1)),axis=1)
+            image=rasterize_segments(ends,weights,resolution)
+            coverage=image[:,:,3]
+            with np.errstate(divide='ignore',invalid='ignore'):
+                mean_color=np.nan_to_num(image[:,:,:3]/coverage[:,:,None])
+            alpha=1-np.exp(-coverage)[:,:,None]
+            rgb=1-alpha*(1-mean_color)
+        else:
+            stick_cmap={'s':'b','m':'r','v':'k'}
+            weights=(sticks.kind[:,None]==np.arange(len(stick_kinds))[None,:]).astype(float)
+            rgb=coverage_to_rgb(rasterize_segments(ends,weights,resolution),[stick_cmap[k] for k in stick_kinds])
+        if junctions:
+            ms=np.isin(self.intersects.kind,junction_codes(['ms','sm']))
+            isects=rasterize_points(self.intersects.x[ms],self.intersects.y[ms],resolution=resolution)
+            rgb=rgb*(1-(1-np.exp(-isects))[:,:,None]*(1-np.array(matplotlib.colors.to_rgb('g'))))
+        ax.imshow(rgb, extent=(0,1,0,1), origin='lower', interpolation='nearest')
+        ax.set_xlim((-0.02,1.02))
+        ax.set_ylim((-0.02,1.02))
+        pass
+
+    def plot_currents_raster(self,ax1,resolution=1000):
+        """raster version of plot_currents, edges drawn as segments between
+        their node positions weighted by current, on a log color scale"""
+        graph=self.cnet.graph
+        edges=list(graph.edges)
+        ends=np.array([[graph.nodes[n1]['pos'],graph.nodes[n2]['pos']] for n1,n2 in edges],dtype=float)
+        currents=np.array([graph.edges[e]['current'] for e in edges],dtype=float)
+        coverage=rasterize_segments(ends,np.ones(len(edges)),resolution)
+        image=rasterize_segments(ends,currents,resolution)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            image=np.ma.masked_where(coverage==0,image/coverage)
+        ax1.imshow(image, extent=(0,1,0,1), origin='lower', interpolation='nearest', cmap=plt.get_cmap('YlOrRd'), norm=matplotlib.colors.LogNorm())
+        pass
+
+    def plot_voltages_raster(self,ax1,resolution=1000):
+        """raster version of plot_voltages, each stick in the conducting
+        network drawn with the voltage of its node"""
+        pos,voltages=self.field_values('voltage')
+        ends=self.sticks.ends[self.cnet.nodelist]
+        coverage=rasterize_segments(ends,np.ones(len(ends)),resolution)
+        image=rasterize_segments(ends,voltages,resolution)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            image=np.ma.masked_where(coverage==0,image/coverage)
+        ax1.imshow(image, extent=(0,1,0,1), origin='lower', interpolation='nearest', cmap=plt.get_cmap('YlOrRd'))
+        pass
+
     # from network
     def show_cnet(self,ax=False,v=False, current = True, voltage=True):
         if not(ax):
@@ -252,6 +407,211 @@ class CNTNetviewer(RandomCNTNetwork):
             plt.close()
         pass
 
+    def field_values(self,value):
+        """positions and values of a solved quantity in a fixed order, nodes
+        in cnet.nodelist order for voltage and edges in graph order for current
+        """
+        if value=='voltage':
+            items=[self.cnet.graph.nodes[k] for k in self.cnet.nodelist]
+        elif value=='current':
+            items=[self.cnet.graph.edges[k] for k in self.cnet.graph.edges]
+        pos=np.array([i['pos'] for i in items],dtype=float)
+        z=np.array([i[value] for i in items],dtype=float)
+        return pos,z
+
+class ContourFrameRenderer(object):
+    """Renders a series of frames of one quantity sampled at fixed positions,
+    as in plot_contour. The triangulation, the linear interpolation weights onto
+    the pixel grid and the figure are built once, and each frame only updates
+    the image data, so a gate sweep does not rebuild any of them.
+    """
+    def __init__(self,pos,value='voltage',scaling=5,resolution=100,colormap="YlOrRd",figsize=(6.3,6.3)):
+        x=pos[:,0]
+        y=pos[:,1]
+        self.shape=(resolution,resolution)
+        xi = np.linspace(0,1,resolution)
+        Xi, Yi = np.meshgrid(xi, xi)
+        triang = tri.Triangulation(x, y)
+        tri_index=triang.get_trifinder()(Xi, Yi).ravel()
+        self.inside=tri_index>=0
+        # barycentric weights of each pixel within its enclosing triangle,
+        # identical to what LinearTriInterpolator evaluates per call
+        self.corners=triang.triangles[tri_index[self.inside]]
+        px=Xi.ravel()[self.inside]
+        py=Yi.ravel()[self.inside]
+        x0,x1,x2=x[self.corners].T
+        y0,y1,y2=y[self.corners].T
+        with np.errstate(divide='ignore',invalid='ignore'):
+            det=(y1-y2)*(x0-x2)+(x2-x1)*(y0-y2)
+            w0=((y1-y2)*(px-x2)+(x2-x1)*(py-y2))/det
+            w1=((y2-y0)*(px-x2)+(x0-x2)*(py-y2))/det
+        self.weights=np.stack([w0,w1,1-w0-w1],axis=1)
+
+        self.fig, self.ax = plt.subplots(1,figsize=figsize)
+        self.title=self.ax.set_title("")
+        self.image=self.ax.imshow(np.ma.masked_all(self.shape), extent=(0,1,0,1), origin='lower', cmap=colormap, alpha=0.7, interpolation='nearest')
+        self.ax.set_yticks([0,0.2,0.4,0.6,0.8,1])
+        self.ax.set_yticklabels(['{:.0f}'.format(i/5*scaling) for i in range(6)])
+        self.ax.set_xticks([0,0.2,0.4,0.6,0.8,1])
+        self.ax.set_xticklabels(['{:.0f}'.format(i/5*scaling) for i in range(6)])
+        self.ax.set_ylabel("$\mu m$")
+        self.ax.set_xlabel("$\mu m$")
+        self.fig.tight_layout()
+        axins = inset_axes(self.ax, width="40%",  height="5%", loc=9, bbox_to_anchor=(0, 0, 1, 1), bbox_transform=self.ax.transAxes, borderpad=0)
+        self.cbar=plt.colorbar(self.image, cax=axins, orientation='horizontal')
+        self.cbar.set_label({'voltage':'V','current':'I'}.get(value,value),labelpad=-10)
+
+    def interpolate(self,z):
+        zi=np.full(self.shape[0]*self.shape[1],np.nan)
+        zi[self.inside]=(self.weights*np.asarray(z)[self.corners]).sum(axis=1)
+        return np.ma.masked_invalid(zi.reshape(self.shape))
+
+    def draw(self,z,title=''):
+        zi=self.interpolate(z)
+        zmax=float(zi.max()) if zi.count() else 0
+        self.image.set_data(zi)
+        self.image.set_clim(0,zmax if zmax>0 else 1)
+        self.cbar.set_ticks([0,zmax])
+        self.cbar.set_ticklabels(["{:.1f}".format(0),"{:.0e}".format(zmax)])
+        self.title.set_text(title)
+        return zi
+
+    def save(self,fname,formats=('png',)):
+        for fmt in formats:
+            self.fig.savefig("{}.{}".format(fname,fmt))
+
+    def close(self):
+        plt.close(self.fig)
+
+def show_field(dataset, gate, vg, value='voltage', show=True, save=False, formats=('png',)):
+    """
+    Contour plot of one frame of a fielddata.FieldDataset, without loading or
+    solving the device.
+
+    Args:
+      dataset: FieldDataset or the path of one
+      gate: gate type of the frame
+      vg: gate voltage of the frame, which must have been stored
+      value: 'voltage' or 'current'
+      save: file name to save the figure under, without extension
+    """
+    if not isinstance(dataset,FieldDataset):
+        dataset=FieldDataset(dataset)
+    renderer=ContourFrameRenderer(dataset.pos(value),value=value,scaling=dataset.scaling)
+    renderer.draw(dataset.frame(gate,value,dataset.index(gate,vg)),"{} gate = {:04.1f} V".format(gate,float(vg)))
+    if save:
+        renderer.save(save,formats)
+    if show:
+        plt.show()
+    return renderer
+
+# device or field dataset loaded once per rendering worker process
+_sweep_source=None
+
+def _init_sweep_worker(directory,fname,fields=None):
+    global _sweep_source
+    plt.switch_backend('Agg')
+    if fields:
+        _sweep_source=FieldDataset(fields)
+    else:
+        _sweep_source=CNTNetviewer(directory=directory,fname=fname)
+
+def _sweep_frames(gatetype,values,vgvalues):
+    """positions of each value, scaling and a generator of (vg, {value: z})
+    over the sweep, read from the dataset or solved on the device once per vg
+    for all values"""
+    source=_sweep_source
+    if isinstance(source,FieldDataset):
+        if vgvalues is None:
+            vgvalues=source.vg(gatetype)
+        frames=((vg,{value:source.frame(gatetype,value,source.index(gatetype,vg)) for value in values}) for vg in vgvalues)
+        return {value:source.pos(value) for value in values},source.scaling,frames
+    if vgvalues is None:
+        vgvalues=range(-10,11,2)
+    def solve():
+        for vg in vgvalues:
+            source.gate(vg,gatetype)
+            yield vg,{value:source.field_values(value)[1] for value in values}
+    return {value:source.field_values(value)[0] for value in values},source.scaling,solve()
+
+def _render_sweep(gatetype,values,vgvalues,outdir,output,formats,fps):
+    pos,scaling,frames=_sweep_frames(gatetype,values,vgvalues)
+    renderers={value:ContourFrameRenderer(pos[value],value=value,scaling=scaling) for value in values}
+    jobdirs={value:os.path.join(outdir,gatetype+"_"+value) for value in values}
+    stems={value:os.path.join(jobdirs[value],"{}_{}".format(gatetype,value)) for value in values}
+    outputs=[]
+    with ExitStack() as stack:
+        if output=='video':
+            writers={}
+            for value in values:
+                writers[value]=animation.FFMpegWriter(fps=fps)
+                stack.enter_context(writers[value].saving(renderers[value].fig,stems[value]+".mp4",dpi=renderers[value].fig.dpi))
+        images={value:[] for value in values}
+        for vg,z in frames:
+            for value in values:
+                renderer=renderers[value]
+                renderer.draw(z[value],"{} gate = {:04.1f} V".format(gatetype,float(vg)))
+                if output=='video':
+                    writers[value].grab_frame()
+                elif output=='strip':
+                    renderer.fig.canvas.draw()
+                    images[value].append(np.asarray(renderer.fig.canvas.buffer_rgba())[:,:,:3].copy())
+                else:
+                    # numbered vg+10 like the original render script
+                    frame="{}/{:g}_{}{}{:04.1f}_contour".format(jobdirs[value],float(vg)+10,gatetype,value,float(vg))
+                    renderer.save(frame,formats)
+                    outputs.append(frame)
+    for value in values:
+        if output=='video':
+            outputs.append(stems[value]+".mp4")
+        elif output=='strip':
+            plt.imsave(stems[value]+"_strip.png",np.concatenate(images[value],axis=1))
+            outputs.append(stems[value]+"_strip.png")
+        renderers[value].close()
+    return outputs
+
+def render_gatesweep(fname, directory='data', outdir=None, vgvalues=None, gates=('back','partial','total'), values=('voltage','current'), processes=1, output='frames', formats=('png',), fps=4, fields=None):
+    """
+    Args:
+      fname: saved device to load (see RandomConductingNetwork.save_system)
+      directory: directory the device was saved in
+      outdir: where to write frames, defaults to fname
+      vgvalues: gate voltages of the sweep, one frame each. Defaults to
+        range(-10,11,2) when solving, and every stored frame with fields
+      gates: gate types to sweep
+      values: quantities to render, 'voltage' and/or 'current'
+      processes: number of headless worker processes, each loads the device once
+      output: 'frames' writes one file per frame in each of formats,
+        'strip' writes a single image strip and 'video' an mp4 via ffmpeg, per
+        gate type and quantity
+      formats: file formats of individual frames
+      fps: frame rate of video output
+      fields: path of a fielddata dataset to read the frames from, in which
+        case the device is neither loaded nor solved
+
+    Returns:
+        list of files written
+    """
+    if output=='video' and not animation.writers.is_available('ffmpeg'):
+        raise RuntimeError("video output requires ffmpeg")
+    if outdir is None:
+        outdir=fname
+    if vgvalues is not None:
+        vgvalues=list(vgvalues)
+    values=list(values)
+    # one job per gate type, solving each gate voltage once for every value
+    jobs=[]
+    for gatetype in gates:
+        for value in values:
+            os.makedirs(os.path.join(outdir,gatetype+"_"+value),exist_ok=True)
+        jobs.append((gatetype,values,vgvalues,outdir,output,formats,fps))
+    pool=Pool(processes,initializer=_init_sweep_worker,initargs=(directory,fname,fields))
+    results=[pool.apply_async(_render_sweep,args=job) for job in jobs]
+    outputs=[f for res in results for f in res.get()]
+    pool.close()
+    pool.join()
+    return outputs
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("-t", "--test", action="store_true")